@@ -20,7 +20,9 @@ The exported files will be placed in the specified output directory (default: _s
 # ]
 # ///
 
+import ast
 import subprocess
+from collections import defaultdict
 from typing import List, Union
 from pathlib import Path
 
@@ -133,6 +135,53 @@ def _generate_index(output_dir: Path, template_file: Path, notebooks_data: List[
         logger.error(f"Error rendering template: {e}")
 
 
+def _shared_definitions(path: Path) -> dict:
+    """Collect the source of the setup constants and `@app.function` functions of a marimo notebook.
+
+    Args:
+        path (Path): Path to the marimo notebook (.py file)
+
+    Returns:
+        dict: The source of each definition, decorators included, keyed by its name
+    """
+    source = path.read_text()
+    definitions = {}
+    for node in ast.parse(source).body:
+        # constants assigned in the `with app.setup:` cell
+        if isinstance(node, ast.With) and any(ast.unparse(item.context_expr) == "app.setup" for item in node.items):
+            for statement in node.body:
+                if isinstance(statement, ast.Assign) and len(statement.targets) == 1 and isinstance(statement.targets[0], ast.Name):
+                    definitions[statement.targets[0].id] = ast.get_source_segment(source, statement)
+        elif isinstance(node, ast.FunctionDef) and any(ast.unparse(decorator) == "app.function" for decorator in node.decorator_list):
+            decorators = "".join(f"@{ast.get_source_segment(source, decorator)}\n" for decorator in node.decorator_list)
+            definitions[node.name] = decorators + ast.get_source_segment(source, node)
+    return definitions
+
+
+def _check_shared_definitions(folder: Path) -> bool:
+    """Check that the constants and functions defined in several notebooks of a folder are identical.
+
+    Each notebook is exported to WebAssembly on its own and cannot import a local module, so the
+    apps that share code carry their own copy of it. This catches the copies drifting apart.
+
+    Args:
+        folder (Path): Path to the folder containing marimo notebooks
+
+    Returns:
+        bool: True if every definition shared by several notebooks has the same source in all of them
+    """
+    copies = defaultdict(dict)
+    for notebook in sorted(folder.rglob("*.py")):
+        for name, source in _shared_definitions(notebook).items():
+            copies[name][notebook] = source
+    consistent = True
+    for name, sources in copies.items():
+        if len(set(sources.values())) > 1:
+            logger.error(f"`{name}` differs between {', '.join(map(str, sources))}; keep its copies identical")
+            consistent = False
+    return consistent
+
+
 def _export(folder: Path, output_dir: Path, as_app: bool=False) -> List[dict]:
     """Export all marimo notebooks in a folder to HTML/WebAssembly format.
 
@@ -183,8 +232,9 @@ def main(
 
     This function:
     1. Parses command line arguments
-    2. Exports all marimo notebooks in the 'notebooks' and 'apps' directories
-    3. Generates an index.html file that lists all the notebooks
+    2. Checks that the code copied between apps is identical
+    3. Exports all marimo notebooks in the 'notebooks' and 'apps' directories
+    4. Generates an index.html file that lists all the notebooks
 
     Command line arguments:
         --output-dir: Directory where the exported files will be saved (default: _site)
@@ -206,6 +256,10 @@ def main(
     template_file: Path = Path(template)
     logger.info(f"Using template file: {template_file}")
 
+    # Stop before exporting anything if the code shared between apps has drifted apart
+    if not _check_shared_definitions(Path("apps")):
+        raise SystemExit(1)
+
     # Export notebooks from the notebooks/ directory
     notebooks_data = _export(Path("notebooks"), output_dir, as_app=False)
 
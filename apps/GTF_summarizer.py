@@ -2,6 +2,7 @@
 # requires-python = ">=3.13"
 # dependencies = [
 #     "pandas==2.3.3",
+#     "pyarrow",
 # ]
 # ///
 
@@ -10,133 +11,733 @@ import marimo
 __generated_with = "0.18.4"
 app = marimo.App(width="medium")
 
-
-@app.cell
-def _():
+with app.setup:
+    from concurrent.futures import ProcessPoolExecutor
+    from functools import partial
     import gzip
+    import hashlib
     import io
     from itertools import batched
     import marimo as mo
+    import numpy as np
     import os
     import pandas as pd
+    from pandas.api.types import union_categoricals
+    from pathlib import Path
     import re
+    import sys
+    import tempfile
+    import time
+    from urllib.parse import unquote
     pd.options.mode.copy_on_write = True
-    return batched, gzip, io, mo, pd, re
+
+    GTF_COLUMNS = ["seqname", "source", "feature", "start", "end", "score", "strand", "frame", "attribute"]
+    # low-cardinality columns are categorical and coordinates are 32-bit, which keeps the table small enough for the browser
+    GTF_DTYPES = {"seqname": "category", "source": "category", "feature": "category", "start": "uint32", "end": "uint32", "score": "category", "strand": "category", "frame": "category", "attribute": str}
+    # the key at the end of the text preceding a quoted value, e.g. `; gene_name ` -> `gene_name`
+    ATTRIBUTE_KEY = re.compile(r'(\w+)[^\S\n]+$')
+    # a GFF3 attribute column whose every `;`-separated field has exactly one `=`
+    GFF3_REGULAR = re.compile(r'[^=;]*=[^=;]*(?:;[^=;]*=[^=;]*)*')
+    # decompressed bytes read from the start of a file to tell GFF3 from GTF
+    SNIFF_SIZE = 1 << 16
+    # decompressed bytes parsed at a time; bounds the transient memory of parsing to a few times this
+    BLOCK_SIZE = 1 << 21
+    GZIP_MAGIC = b"\x1f\x8b"
+    # a BGZF block header: gzip magic, deflate, FEXTRA flag, then XLEN = 6 holding only the `BC` block-size subfield
+    BGZF_MAGIC = b"\x1f\x8b\x08\x04"
+    BGZF_EXTRA = b"\x06\x00BC\x02\x00"
+    # compressed bytes of BGZF blocks handed to each worker
+    BGZF_CHUNK_SIZE = 1 << 20
+    # parsed tables are cached as Parquet files, evicting the least recently used past CACHE_SIZE bytes;
+    # not in the browser, where the temporary directory is held in memory and forgotten on reload
+    CACHE_DIR = Path(tempfile.gettempdir()) / "gtf_summarizer_cache"
+    CACHE_SIZE = 4_000_000_000
+    # part of the cache key, so that tables cached by an older parser are not reused
+    CACHE_VERSION = 2
+    GTF_FEATURES = ["gene", "transcript", "exon", "CDS", "UTR", "five_prime_utr", "three_prime_utr", "start_codon", "stop_codon", "Selenocysteine"]
+    # autosomes, sex chromosomes and mitochondria, with or without a `chr` prefix
+    PRIMARY_SEQNAMES = r"(chr)?([0-9]+|[XYZW]|MT?)"
+    # rows previewed while a file is parsed, and the seconds between updates of the preview
+    PREVIEW_ROWS = 5
+    PREVIEW_INTERVAL = 0.5
+    # a genomic region such as `chr1:1,000,000-2,000,000`
+    REGION = re.compile(r"(\S+):([\d,]+)-([\d,]+)")
 
 
 @app.cell
-def _(mo):
+def _():
     file_import = mo.ui.file(
         kind="area",
-        filetypes = [".gtf", ".GTF", ".gtf.gz", ".GTF.gz", ".GTF.GZ", ".gff", ".GFF", ".gff.gz", ".GFF.gz", ".GFF.GZ"],
-        label = "Drag and drop the GTF file here, or click to open file browser.",
+        filetypes = [".gtf", ".GTF", ".gtf.gz", ".GTF.gz", ".GTF.GZ", ".gff", ".GFF", ".gff.gz", ".GFF.gz", ".GFF.GZ", ".gff3", ".GFF3", ".gff3.gz", ".GFF3.gz", ".GFF3.GZ"],
+        label = "Drag and drop the GTF or GFF3 file here, or click to open file browser.",
         max_size =  2000000000
     )
-    return (file_import,)
+    feature_filter = mo.ui.multiselect(
+        options = GTF_FEATURES,
+        label = "Only keep these feature types (`gene` is always kept, all are kept if none are selected)"
+    )
+    primary_only = mo.ui.switch(label = "Skip scaffolds, patches and unplaced contigs")
+    attribute_filter = mo.ui.text(
+        label = "Only keep these attributes (comma-separated, all are kept if empty)",
+        placeholder = "gene_name, gene_biotype"
+    )
+    return attribute_filter, feature_filter, file_import, primary_only
 
 
 @app.cell
-def _(file_import, mo):
-    mo.sidebar([mo.md('# GTF Summarizer\nThe maximum file size is 2GB. If your file is larger than 2GB, you can try to gz-compress the file to shrink it.'), file_import], footer = mo.md('<img src="public/gih_logo.png" width="200" />\n\nMade with ❤️ for 🧬'))
+def _(attribute_filter, feature_filter, file_import, primary_only):
+    mo.sidebar(
+        [
+            mo.md('# GTF Summarizer\nThe maximum file size is 2GB. If your file is larger than 2GB, you can try to gz-compress the file to shrink it.'),
+            file_import,
+            mo.accordion({"Filter rows while parsing": mo.vstack([feature_filter, primary_only, attribute_filter])})
+        ],
+        footer = mo.md('<img src="public/gih_logo.png" width="200" />\n\nMade with ❤️ for 🧬')
+    )
     return
 
 
-@app.cell
-def _(re):
-    def parse_attributes(text):
-        """Process the attributes column of a GTF file and correctly assign key-value pairs"""
-        result = {}
-        # Find all key followed by one or more quoted values
-        pattern = r'(\w+)\s+((?:"[^"]+"\s*)+)'
+@app.function
+def iter_line_blocks(handle, block_size=BLOCK_SIZE):
+    """Read a binary file handle in fixed-size chunks and yield them cut at the last newline, stopping at a GFF3 `##FASTA` line"""
+    remainder = b""
+    while chunk := handle.read(block_size):
+        chunk = remainder + chunk
+        cut = chunk.rfind(b"\n") + 1
+        remainder = chunk[cut:]
+        block, fasta = cut_fasta(chunk[:cut])
+        if block:
+            yield block
+        if fasta:
+            return
+    if remainder := cut_fasta(remainder)[0]:
+        yield remainder
 
-        for match in re.finditer(pattern, text):
-            key = match.group(1)
-            values_str = match.group(2)
 
-            # Extract all quoted values for this key
-            values = re.findall(r'"([^"]+)"', values_str)
+@app.function
+def cut_fasta(text):
+    """The text before a `##FASTA` line, after which a GFF3 file holds sequences instead of features, and whether there was one"""
+    position = 0 if text.startswith(b"##FASTA") else text.find(b"\n##FASTA") + 1
+    if position or text.startswith(b"##FASTA"):
+        return text[:position], True
+    return text, False
 
-            # Store as single value or list
-            result[key] = values[0] if len(values) == 1 else ", ".join(values)
 
-        return result
-    return (parse_attributes,)
+@app.function
+def is_gff3(text):
+    """Whether the start of an annotation file is GFF3, by its `##gff-version` pragma or else by the `key=value` attributes of its first feature"""
+    for line in text.splitlines():
+        if line.startswith(b"##gff-version"):
+            return line.split()[1:2] != [] and line.split()[1].startswith(b"3")
+        if line.strip() and not line.startswith(b"#"):
+            fields = line.split(b"\t")
+            return len(fields) > 8 and b"=" in fields[8] and b'"' not in fields[8]
+    return False
 
 
-@app.cell
-def _(file_import, gzip, io, mo, parse_attributes, pd):
-    wait_text = """/// admonition| Input file required.\n\nCannot proceed until a file is uploaded\n///"""
-    mo.stop(not file_import.value, mo.md(wait_text))
+@app.function
+def tokenize_attributes(attributes):
+    """Split a column of GTF attribute strings into long-form `row`, `key`, `value` columns.
 
-    if file_import.name().lower().endswith(".gz"):
-        infile = gzip.open(io.BytesIO(file_import.contents()), "r")
-    else:
-        infile = io.BytesIO(file_import.contents())
+    Instead of running a regex on every row, the whole column is split on `"` in one go, which
+    alternates between separator text and values. The separators only take a handful of distinct
+    forms (`; gene_name `, a newline followed by `gene_id `, ...), so the key tokenizer runs once
+    per distinct separator and the result is broadcast back to every value.
+    """
+    # a line with an odd number of quotes ends in an unterminated value, which is never a match
+    attributes = [text[:text.rfind('"')] if text.count('"') % 2 else text for text in attributes]
+    parts = "\n".join(attributes).split('"')
+    values = np.array(parts[1::2], dtype=object)
+    codes, separators = pd.factorize(np.array(parts[0:-1:2], dtype=object))
 
-    df = pd.read_csv(
-        infile,
+    newlines = np.array([sep.count("\n") for sep in separators], dtype=np.int64)
+    keys = np.array([m.group(1) if (m := ATTRIBUTE_KEY.search(sep)) else "" for sep in separators], dtype=object)
+    continued = np.array([not sep.strip() and "\n" not in sep for sep in separators], dtype=bool)
+
+    tokens = pd.DataFrame({"row": newlines[codes].cumsum(), "key": keys[codes], "value": values})
+    # an empty value is never a match and also ends a `tag "a" "b"` run of values
+    empty = values == ""
+    tokens.loc[empty, "key"] = ""
+    continued = continued[codes] & ~empty
+    if continued.any():
+        position = np.arange(len(values))
+        head = np.maximum.accumulate(np.where(continued, 0, position))
+        depth = position - head
+        for level in range(1, depth.max() + 1):
+            extra = np.flatnonzero(continued & (depth == level))
+            values[head[extra]] = values[head[extra]] + ", " + values[extra]
+        tokens["value"] = values
+        tokens.loc[continued, "key"] = ""
+    return tokens[tokens["key"] != ""].reset_index(drop=True)
+
+
+@app.function
+def tokenize_gff3_attributes(attributes):
+    """Split a column of GFF3 `key=value;key=value` attribute strings into long-form `row`, `key`, `value` columns.
+
+    A row with one `=` per field is split in a single pass over the whole column; only malformed
+    rows are split field by field. Values are URL-unescaped, and their comma-separated lists joined
+    with `, ` like repeated GTF tags, once per distinct value rather than once per row.
+    """
+    texts = ["" if text == "." else text.strip().strip(";") for text in attributes]
+    counts = np.array([text.count(";") + 1 if text else 0 for text in texts], dtype=np.int64)
+    regular = np.array([not text or GFF3_REGULAR.fullmatch(text) is not None for text in texts], dtype=bool)
+
+    # with one `=` per field, swapping the `;` for `=` makes the whole column alternate between keys and values
+    parts = ";".join(text for text, ok in zip(texts, regular) if ok and text).replace(";", "=").split("=")
+    rows = [np.repeat(np.flatnonzero(regular), counts[regular])]
+    keys = parts[0::2] if len(parts) > 1 else []
+    values = parts[1::2]
+    for row in np.flatnonzero(~regular):
+        fields = [field.partition("=") for field in texts[row].split(";")]
+        fields = [(key, value) for key, separator, value in fields if separator]
+        rows.append(np.full(len(fields), row, dtype=np.int64))
+        keys += [key for key, _ in fields]
+        values += [value for _, value in fields]
+
+    key_codes, key_names = pd.factorize(np.array(keys, dtype=object))
+    value_codes, uniques = pd.factorize(np.array(values, dtype=object))
+    key_names = np.array([key.strip() for key in key_names], dtype=object)
+    uniques = np.array([
+        ", ".join(unquote(item) for item in value.split(",")) if "%" in value or "," in value else value
+        for value in uniques
+    ], dtype=object)
+    tokens = pd.DataFrame({"row": np.concatenate(rows), "key": key_names[key_codes], "value": uniques[value_codes]})
+    return tokens[(tokens["key"] != "") & (tokens["value"] != "")].reset_index(drop=True)
+
+
+@app.function
+def parse_gtf_block(block, gff3=False, features=None, seqnames=None, attributes=None):
+    """Parse a newline-aligned block of GTF (or, with `gff3`, GFF3) text into a table with one column per attribute key.
+
+    Rows can be limited to the `features` types and to the sequence names that fully match the
+    `seqnames` regular expression, and columns to the `attributes` keys (`gene_id`, or `ID` and
+    `Parent` for GFF3, are always kept). Rows are filtered before their attributes are tokenized,
+    except that GFF3 rows are only limited to `features` by `finish_table`, because the rows in
+    between are needed to follow `Parent` links up to the gene.
+    """
+    table = pd.read_csv(
+        io.BytesIO(block),
         delimiter="\t",
         header = None,
         comment = "#",
         skip_blank_lines=True,
-        names = ["seqname", "source", "feature", "start", "end", "score", "strand", "frame", "attribute"],
-        converters= {
-            "attribute" : parse_attributes
-        }
+        names = GTF_COLUMNS,
+        dtype = GTF_DTYPES
     )
+    keep = np.ones(len(table), dtype=bool)
+    if features is not None and not gff3:
+        keep &= table["feature"].isin(features).to_numpy()
+    if seqnames is not None:
+        names = table["seqname"].dropna().unique()
+        keep &= table["seqname"].isin([name for name in names if re.fullmatch(seqnames, name)]).to_numpy()
+    if not keep.all():
+        table = table[keep].reset_index(drop=True)
+
+    tokenize = tokenize_gff3_attributes if gff3 else tokenize_attributes
+    tokens = tokenize(table.pop("attribute").fillna(""))
+    if attributes is not None:
+        tokens = tokens[tokens["key"].isin({*(["ID", "Parent"] if gff3 else ["gene_id"]), *attributes})]
+    columns = {}
+    for key, group in tokens.groupby("key", sort=False):
+        # a repeated key keeps its last value
+        group = group.drop_duplicates("row", keep="last")
+        values, categories = pd.factorize(group["value"])
+        codes = np.full(len(table), -1, dtype=values.dtype)
+        codes[group["row"].to_numpy()] = values
+        columns[key] = pd.Categorical.from_codes(codes, categories)
+    return pd.concat([table, pd.DataFrame(columns)], axis=1)
+
+
+@app.function
+def concat_blocks(blocks):
+    """Stack parsed blocks into one table, merging the categories of each categorical column.
+
+    Each column is released from the blocks as soon as it is stacked, so the blocks and the
+    stacked table are never held in memory at the same time.
+    """
+    columns = list(dict.fromkeys(column for block in blocks for column in block.columns))
+    stacked = {}
+    for column in columns:
+        parts = [block.pop(column) if column in block else pd.Series(pd.Categorical.from_codes(np.full(len(block), -1), [])) for block in blocks]
+        if all(isinstance(part.dtype, pd.CategoricalDtype) for part in parts):
+            stacked[column] = union_categoricals([part.array for part in parts])
+        else:
+            stacked[column] = pd.concat(parts, ignore_index=True)
+        del parts
+    return pd.DataFrame(stacked, copy=False)
+
 
-    df.insert(8, 'gene id', [i["gene_id"] for i in df['attribute']])
-    for j in df['attribute']:
-        del j["gene_id"]
+@app.function
+def resolve_gff3_genes(df):
+    """The `ID` of the top-level feature each row of a GFF3 table descends from by its (first) `Parent`, e.g. exon -> mRNA -> gene"""
+    if "ID" not in df:
+        return pd.Categorical.from_codes(np.full(len(df), -1), [])
+    ids = df["ID"].array
+    first_row = np.full(len(ids.categories), -1)
+    present = np.flatnonzero(ids.codes >= 0)
+    first_row[ids.codes[present[::-1]]] = present[::-1]
+
+    up = np.arange(len(df))
+    if "Parent" in df and len(df["Parent"].array.categories):
+        parents = df["Parent"].array
+        # a comma-separated list of parents has been joined with `, `; the first one is followed
+        parent_ids = ids.categories.get_indexer(parents.categories.str.split(", ").str[0])
+        parent_rows = np.where(parent_ids >= 0, first_row[parent_ids], -1)
+        parent_row = np.where(parents.codes >= 0, parent_rows[parents.codes], -1)
+        up = np.where(parent_row >= 0, parent_row, up)
+        # pointer jumping doubles the distance covered each step; the bound stops on cyclic parents
+        for _ in range(64):
+            jumped = up[up]
+            if (jumped == up).all():
+                break
+            up = jumped
+    return pd.Categorical.from_codes(ids.codes[up], ids.categories)
+
+
+@app.function
+def finish_table(blocks, gff3=False, features=None):
+    """Stack the parsed blocks of a GTF file and move `gene_id` next to the fixed columns as `gene id`.
+
+    GFF3 files have no `gene_id`, so the gene of each row is resolved from the `ID` and `Parent`
+    attributes instead, and only then are the rows limited to the `features` types.
+    """
+    if not blocks:
+        return pd.DataFrame(columns = GTF_COLUMNS[:8] + ["gene id"])
+    df = concat_blocks(blocks)
+    if gff3:
+        df.insert(8, "gene id", resolve_gff3_genes(df))
+        if features is not None:
+            df = df[df["feature"].isin(features).to_numpy()].reset_index(drop=True)
+    else:
+        # every row can be filtered out, leaving no `gene_id` column
+        df.insert(8, "gene id", df.pop("gene_id") if "gene_id" in df else pd.Categorical.from_codes(np.full(len(df), -1), []))
+    return df
+
+
+@app.function
+def parse_gtf(handle, block_size=BLOCK_SIZE, gff3=False, **filters):
+    """Stream a GTF (or, with `gff3`, GFF3) file handle block by block and return a single table with one categorical column per attribute key.
+
+    `filters` are passed on to `parse_gtf_block`.
+    """
+    return finish_table([parse_gtf_block(block, gff3, **filters) for block in iter_line_blocks(handle, block_size)], gff3, filters.get("features"))
+
+
+@app.function
+def open_annotation(name, contents):
+    """Open the uploaded bytes of a GTF file as a binary file handle that inflates gzip data as it is read.
+
+    `gzip.GzipFile` decompresses one bounded read at a time and carries on across gzip members, so
+    multi-member and BGZF files (a BGZF file is a series of small gzip members) are streamed too and
+    the full decompressed text never exists in memory.
+    """
+    if name.lower().endswith(".gz") or contents[:2] == GZIP_MAGIC:
+        return gzip.GzipFile(fileobj=io.BytesIO(contents), mode="rb")
+    return io.BytesIO(contents)
+
+
+@app.function
+def bgzf_offsets(contents):
+    """The byte offsets of the blocks of a BGZF file, or None if `contents` is not BGZF-compressed"""
+    offsets = []
+    position = 0
+    while position < len(contents):
+        header = contents[position:position + 18]
+        if len(header) < 18 or header[:4] != BGZF_MAGIC or header[10:16] != BGZF_EXTRA:
+            return None
+        offsets.append(position)
+        position += int.from_bytes(header[16:18], "little") + 1
+    return offsets
+
+
+@app.function
+def parse_bgzf_chunk(chunk, first, gff3=False, **filters):
+    """Inflate a run of BGZF blocks and parse the lines that start and end within it.
+
+    A chunk boundary usually falls inside a line, so the bytes before the first newline (unless
+    this is the first chunk) and after the last newline are returned unparsed for stitching. The
+    last value tells whether the chunk reaches the `##FASTA` section of a GFF3 file, past which
+    nothing is parsed.
+    """
+    text = gzip.decompress(chunk)
+    start = 0 if first else text.find(b"\n") + 1
+    fasta = False
+    if gff3:
+        body, fasta = cut_fasta(text[start:])
+        # a chunk entirely within the `##FASTA` section holds sequences, which never contain a tab
+        if b"\t" not in body:
+            body, fasta = b"", True
+        text = text[:start] + body
+    end = max(start, text.rfind(b"\n") + 1)
+    table = parse_gtf_block(text[start:end], gff3, **filters) if end > start else None
+    return text[:start], table, text[end:], fasta
+
+
+@app.function
+def iter_bgzf_blocks(contents, offsets, workers=None, chunk_size=BGZF_CHUNK_SIZE, gff3=False, **filters):
+    """Inflate and parse runs of the blocks of a BGZF-compressed GTF file on a process pool, yielding the parsed tables in file order"""
+    starts = [0]
+    for offset in offsets:
+        if offset - starts[-1] >= chunk_size:
+            starts.append(offset)
+    chunks = [contents[start:end] for start, end in zip(starts, starts[1:] + [len(contents)])]
+    with ProcessPoolExecutor(workers) as pool:
+        results = pool.map(partial(parse_bgzf_chunk, gff3=gff3, **filters), chunks, [i == 0 for i in range(len(chunks))])
+
+        # merge in file order, parsing the lines split across chunks where they belong
+        carry = b""
+        for head, table, tail, fasta in results:
+            carry += head
+            if table is not None:
+                if carry:
+                    yield parse_gtf_block(carry, gff3, **filters)
+                yield table
+                carry = b""
+            carry += tail
+            if fasta:
+                pool.shutdown(cancel_futures=True)
+                break
+    if carry:
+        yield parse_gtf_block(carry, gff3, **filters)
+
+
+@app.function
+def iter_annotation_blocks(name, contents, workers=None, gff3=False, **filters):
+    """Parse the uploaded bytes of a GTF or GFF3 file block by block, in parallel if it is BGZF-compressed, yielding the parsed tables in file order.
+
+    Plain and gzipped files, and any file in the browser (WebAssembly) build, are parsed sequentially.
+    """
+    offsets = bgzf_offsets(contents)
+    if offsets is None or sys.platform == "emscripten" or (workers or os.cpu_count()) < 2:
+        return (parse_gtf_block(block, gff3, **filters) for block in iter_line_blocks(open_annotation(name, contents)))
+    return iter_bgzf_blocks(contents, offsets, workers, gff3=gff3, **filters)
+
+
+@app.function
+def parse_annotation(name, contents, workers=None, progress=None, **filters):
+    """Parse the uploaded bytes of a GTF or GFF3 file into a single table, telling the formats apart by the start of the file.
+
+    `progress`, if given, is called with each parsed block as soon as it is ready, so that a
+    preview can be shown long before the whole file is parsed.
+    """
+    gff3 = is_gff3(open_annotation(name, contents).read(SNIFF_SIZE))
+    blocks = []
+    for block in iter_annotation_blocks(name, contents, workers, gff3, **filters):
+        blocks.append(block)
+        if progress is not None:
+            progress(block)
+    return finish_table(blocks, gff3, filters.get("features"))
+
+
+@app.function
+def cache_path(contents, cache_dir=CACHE_DIR, **filters):
+    """The cache file of a parsed annotation, named by a hash of its source and the parse-time filters.
+
+    The source is the uploaded bytes or, for a `Path`, the resolved path, size and modification time
+    of the file, so that a file on disk is neither read nor hashed to find its cached table.
+    """
+    if isinstance(contents, Path):
+        stat = contents.stat()
+        digest = hashlib.sha256(repr((str(contents.resolve()), stat.st_size, stat.st_mtime_ns)).encode())
+    else:
+        # SHA-256 is hardware-accelerated on most CPUs, about twice as fast as BLAKE2 on large uploads
+        digest = hashlib.sha256(contents)
+    digest.update(repr(CACHE_VERSION).encode())
+    for name, value in sorted(filters.items()):
+        if value is not None:
+            digest.update(repr((name, value if isinstance(value, str) else sorted(value))).encode())
+    return Path(cache_dir) / f"{digest.hexdigest()}.parquet"
+
+
+@app.function
+def evict_cache(cache_dir=CACHE_DIR, max_size=CACHE_SIZE):
+    """Delete the least recently used cached tables until the cache is no larger than `max_size` bytes"""
+    cached = sorted(Path(cache_dir).glob("*.parquet"), key=lambda path: path.stat().st_mtime)
+    total = sum(path.stat().st_size for path in cached)
+    # the most recently used table is kept even if it alone exceeds the limit
+    for path in cached[:-1]:
+        if total <= max_size:
+            break
+        total -= path.stat().st_size
+        path.unlink(missing_ok=True)
+
+
+@app.function
+def load_annotation(name, contents, cache_dir=CACHE_DIR, max_size=CACHE_SIZE, progress=None, **filters):
+    """Parse an uploaded GTF file, or read its parsed table from the cache if the same bytes were parsed before with the same `filters`.
+
+    `contents` are the bytes of the file or its `Path`, which is only read if it is not cached.
+    Returns the table and whether it came from the cache. `progress` is passed on to `parse_annotation`.
+    The cache is skipped in the browser, where it would only hold a second copy of the table in memory.
+    """
+    if sys.platform == "emscripten":
+        if isinstance(contents, Path):
+            contents = contents.read_bytes()
+        return parse_annotation(name, contents, progress=progress, **filters), False
+
+    path = cache_path(contents, cache_dir, **filters)
+    if path.exists():
+        # the modification time orders the cache for eviction
+        os.utime(path)
+        return pd.read_parquet(path), True
+
+    if isinstance(contents, Path):
+        contents = contents.read_bytes()
+    df = parse_annotation(name, contents, progress=progress, **filters)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".partial")
+    # one row group, so that reading it back does not merge the categories of several chunks
+    df.to_parquet(tmp_path, index=False, row_group_size=max(len(df), 1))
+    tmp_path.replace(path)
+    evict_cache(cache_dir, max_size)
+    return df, False
+
+
+@app.function
+def attribute_keys(df):
+    """The attribute keys stored as columns of a parsed GTF table"""
+    return sorted(df.columns[9:])
+
+
+@app.function
+def join_unique_values(gene_codes, values, n_genes):
+    """The sorted, `;`-joined unique values of an attribute column for each of `n_genes` gene codes"""
+    value_codes, uniques = pd.factorize(values)
+    uniques = np.asarray(uniques).astype(str)
+    order = np.argsort(uniques, kind="stable")
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+
+    # encode each (gene, value) pair as one integer so that np.unique drops duplicates and sorts by gene, then value
+    observed = (gene_codes >= 0) & (value_codes >= 0)
+    pairs = np.unique(gene_codes[observed] * len(uniques) + rank[value_codes[observed]])
+    genes, ranks = np.divmod(pairs, max(len(uniques), 1))
+    starts = np.flatnonzero(np.diff(genes, prepend=-1))
+
+    joined = np.full(n_genes, "", dtype=object)
+    if len(pairs):
+        prefixed = ";" + uniques[order[ranks]].astype(object)
+        joined[genes[starts]] = [text[1:] for text in np.add.reduceat(prefixed, starts)]
+    return joined
+
+
+@app.function
+def gene_rollups(df, gene_codes, n_genes):
+    """Transcript and exon metrics for each of `n_genes` gene codes, computed with one sort of the exon rows.
+
+    `exons` counts distinct exon intervals, `exonic length` is the length of their union, and
+    `longest transcript` is the largest summed exon length of any transcript of the gene.
+    """
+    transcript_codes = pd.factorize(df["transcript_id"])[0] if "transcript_id" in df else np.full(len(df), -1)
+    n_transcripts = transcript_codes.max(initial=-1) + 1
+    has_transcript = (gene_codes >= 0) & (transcript_codes >= 0)
+    gene_transcripts = np.unique(gene_codes[has_transcript].astype(np.int64) * n_transcripts + transcript_codes[has_transcript])
+    transcripts = np.bincount(gene_transcripts // max(n_transcripts, 1), minlength=n_genes)
+
+    is_exon = (df["feature"] == "exon").to_numpy() & (gene_codes >= 0)
+    genes = gene_codes[is_exon]
+    starts = df["start"].to_numpy()[is_exon].astype(np.int64)
+    ends = df["end"].to_numpy()[is_exon].astype(np.int64)
+    lengths = ends - starts + 1
+
+    # spliced length of every transcript, then the longest one of each gene
+    exon_transcripts = transcript_codes[is_exon]
+    in_transcript = exon_transcripts >= 0
+    transcript_lengths = np.bincount(exon_transcripts[in_transcript], weights=lengths[in_transcript], minlength=n_transcripts)
+    transcript_genes = np.full(n_transcripts, -1)
+    transcript_genes[exon_transcripts[in_transcript]] = genes[in_transcript]
+    longest = np.zeros(n_genes)
+    np.maximum.at(longest, transcript_genes[transcript_genes >= 0], transcript_lengths[transcript_genes >= 0])
+
+    # sort by gene then start; offsetting the ends by gene makes a running maximum restart at each gene
+    order = np.lexsort((ends, starts, genes))
+    genes, starts, ends = genes[order], starts[order], ends[order]
+    distinct = np.ones(len(genes), dtype=bool)
+    distinct[1:] = (np.diff(genes) != 0) | (np.diff(starts) != 0) | (np.diff(ends) != 0)
+    offset = genes << 32
+    covered = np.maximum.accumulate(offset + ends) - offset
+    previous = np.concatenate([[0], covered[:-1]])
+    previous[np.flatnonzero(np.diff(genes, prepend=-1))] = 0
+    # the bases of each exon past the furthest end of the exons sorted before it
+    added = np.clip(ends - np.maximum(starts - 1, previous), 0, None)
+
+    return pd.DataFrame({
+        "transcripts": transcripts,
+        "exons": np.bincount(genes[distinct], minlength=n_genes),
+        "exonic length": np.bincount(genes, weights=added, minlength=n_genes).astype(np.int64),
+        "longest transcript": longest.astype(np.int64)
+    })
+
+
+@app.function
+def summarize_genes(df, attributes, rollups=False):
+    """The `gene` rows of a parsed GTF table with the sorted, `;`-joined unique values of the selected attributes of each gene.
+
+    With `rollups`, the transcript and exon metrics of `gene_rollups` are added as well.
+    """
+    is_gene = (df['feature'] == 'gene').to_numpy()
+    summary = df.loc[is_gene, ['gene id', 'seqname', 'start', 'end', 'strand']].reset_index(drop=True)
+    gene_codes, genes = pd.factorize(df['gene id'])
+    summary_codes = gene_codes[is_gene]
+    for key in attributes:
+        joined = join_unique_values(gene_codes, df[key], len(genes))
+        summary[key] = np.where(summary_codes >= 0, joined[summary_codes], np.nan)
+    if rollups:
+        metrics = gene_rollups(df, gene_codes, len(genes))
+        for column in metrics:
+            summary[column] = np.where(summary_codes >= 0, metrics[column].to_numpy()[summary_codes], 0)
+    return summary
+
+
+@app.function
+def build_interval_index(df):
+    """Index the features of a parsed GTF table for overlap queries.
+
+    Maps each seqname to the starts, ends, running maximum of the ends and table row positions
+    of its features, all sorted by start.
+    """
+    starts = df['start'].to_numpy()
+    ends = df['end'].to_numpy()
+    index = {}
+    for seqname, rows in df.groupby('seqname', observed=True, sort=False).indices.items():
+        rows = rows[np.argsort(starts[rows], kind="stable")]
+        index[seqname] = (starts[rows], ends[rows], np.maximum.accumulate(ends[rows]), rows)
+    return index
+
+
+@app.function
+def query_overlaps(index, seqname, start, end):
+    """The table row positions of the features on `seqname` that overlap `start`-`end` (1-based, inclusive), sorted by start"""
+    if seqname not in index:
+        return np.array([], dtype=np.intp)
+    starts, ends, max_ends, rows = index[seqname]
+    # features after `last` start past the region, and every feature before `first` ends before it
+    last = np.searchsorted(starts, end, side="right")
+    first = np.searchsorted(max_ends, start, side="left")
+    return rows[first + np.flatnonzero(ends[first:last] >= start)]
+
+
+@app.function
+def parse_region(text):
+    """Split a `seqname:start-end` region into its seqname and integer coordinates, or return None if it is malformed"""
+    match = REGION.fullmatch(text.strip())
+    if match is None:
+        return None
+    seqname, start, end = match.groups()
+    return seqname, int(start.replace(",", "")), int(end.replace(",", ""))
+
+
+@app.cell
+def _(attribute_filter, feature_filter, file_import, primary_only):
+    wait_text = """/// admonition| Input file required.\n\nCannot proceed until a file is uploaded\n///"""
+    mo.stop(not file_import.value, mo.md(wait_text))
+
+    _attributes = [i.strip() for i in attribute_filter.value.split(",") if i.strip()]
+    _parsed = {"rows": 0, "genes": 0, "preview": None, "shown": 0.0}
+
+    def _show_progress(block):
+        # show the first rows and a running count as blocks arrive instead of waiting for the whole file
+        _parsed["rows"] += len(block)
+        _parsed["genes"] += (block["feature"] == "gene").sum()
+        if _parsed["preview"] is None and len(block):
+            _parsed["preview"] = block.head(PREVIEW_ROWS)
+        if _parsed["preview"] is not None and time.monotonic() - _parsed["shown"] >= PREVIEW_INTERVAL:
+            _parsed["shown"] = time.monotonic()
+            mo.output.replace(mo.ui.table(
+                _parsed["preview"],
+                show_data_types = False,
+                label = f"Parsing `{file_import.name()}`: **{_parsed['rows']:,} rows** and **{_parsed['genes']:,} gene feature rows** so far. Showing the first {PREVIEW_ROWS} rows."
+            ))
+
+    df, _cached = load_annotation(
+        file_import.name(),
+        file_import.contents(),
+        progress = _show_progress,
+        features = {"gene", *feature_filter.value} if feature_filter.value else None,
+        seqnames = PRIMARY_SEQNAMES if primary_only.value else None,
+        attributes = _attributes or None
+    )
 
     _generows = (df['feature'] == 'gene').sum()
-    mdtext = f"Input file `{file_import.value[0].name}` has **{_generows} gene feature rows**. Showing the first 5 rows."""
-    mo.ui.table(df.head(), show_data_types=False, label = mdtext)
+    _megabytes = df.memory_usage(deep=True).sum() / 1e6
+    mdtext = f"Input file `{file_import.value[0].name}` has **{_generows} gene feature rows** ({_megabytes:.0f} MB in memory{', loaded from cache' if _cached else ''}). Showing the first {PREVIEW_ROWS} rows."""
+    mo.ui.table(df.head(PREVIEW_ROWS), show_data_types=False, label = mdtext)
     return (df,)
 
 
 @app.cell
-def _(df, mo):
-    allkey = set()
-    for a1 in df['attribute']:
-        [allkey.add(str(a2)) for a2 in a1]
-    allkeys = sorted(allkey)
+def _(df):
+    interval_index = build_interval_index(df)
+    region = mo.ui.text(
+        label = "Only show genes overlapping a region",
+        placeholder = "chr1:1,000,000-2,000,000",
+        full_width = True
+    )
+    return interval_index, region
+
+
+@app.cell
+def _(df, interval_index, region):
+    mo.stop(not region.value.strip())
+    query = parse_region(region.value)
+    mo.stop(
+        query is None,
+        mo.md(f"/// error| Unrecognized region\n\n`{region.value}` is not a region of the form `seqname:start-end`, e.g. `chr1:1,000,000-2,000,000`.\n///")
+    )
+    overlap_rows = query_overlaps(interval_index, *query)
+    mo.accordion({
+        f"{len(overlap_rows)} features overlap {query[0]}:{query[1]:,}-{query[2]:,}": mo.ui.table(
+            df.iloc[overlap_rows],
+            page_size = 10,
+            show_column_summaries=False,
+            show_data_types=False
+        )
+    })
+    return
+
+
+@app.cell
+def _(df):
+    allkeys = attribute_keys(df)
     switches = mo.ui.array([mo.ui.switch(label=b1) for b1 in allkeys])
+    rollup_switch = mo.ui.switch(label = "Add transcript and exon counts, exonic length and longest transcript (needs `exon` rows and `transcript_id`)")
     button = mo.ui.run_button(label = "Generate output table")
-    return allkeys, button, switches
+    return allkeys, button, rollup_switch, switches
 
 
 @app.cell
-def _(batched, mo, switches):
+def _(region, rollup_switch, switches):
     mo.vstack(
         [
-        mo.md(f"## Summary Table\nThe table below summarizes across unique `gene_id` values and reports the `start`/`end` positions that corrspond to the information in the `gene` rows (of the `feature` column). It includes columns consolidating unique values for the attribute names selected by switching the toggles you see below. Once you select the attributes you want, press the \"**Generate output table**\" button below to create the table (this is done to avoid recomputing the table each time an attribute is selected)."),
-        mo.hstack([mo.vstack(z, gap = 0.05) for z in batched(switches, len(switches) // 3 + 1)])
+        mo.md(f"## Summary Table\nThe table below summarizes across unique `gene_id` values and reports the `start`/`end` positions that corrspond to the information in the `gene` rows (of the `feature` column). It includes columns consolidating unique values for the attribute names selected by switching the toggles you see below. Once you select the attributes you want, press the \"**Generate output table**\" button below to create the table (this is done to avoid recomputing the table each time an attribute is selected). Entering a region limits the table to the genes that overlap it."),
+        mo.hstack([mo.vstack(z, gap = 0.05) for z in batched(switches, len(switches) // 3 + 1)]),
+        rollup_switch,
+        region
         ]
     )
     return
 
 
 @app.cell
-def _(allkeys, button, df, mo, pd, switches):
+def _(allkeys, button, df, rollup_switch, switches):
     mo.stop(not button.value, output = button.center())
     selected_attributes = [i for idx,i in enumerate(allkeys) if switches.value[idx]]
-    generows = df[df['feature'] == 'gene'].iloc[:, [8,0,3,4,6]]
-
-    user_defined_cols = df.groupby('gene id').apply(
-        lambda x: pd.Series({
-            key: ';'.join(
-                sorted(set(
-                    str(d[key]) for d in x['attribute'] if key in d
-                )
-            ))
-            for key in selected_attributes
-        }),
-        include_groups=False
-    ).reset_index()
+    summary = summarize_genes(df, selected_attributes, rollups = rollup_switch.value)
+    return (summary,)
+
+
+@app.cell
+def _(df, interval_index, region, summary):
+    if region.value.strip() and (_query := parse_region(region.value)) is not None:
+        _rows = query_overlaps(interval_index, *_query)
+        _genes = df['gene id'].iloc[_rows][df['feature'].iloc[_rows] == 'gene']
+        summary_view = summary[summary['gene id'].isin(_genes)]
+    else:
+        summary_view = summary
 
     mo.ui.table(
-        generows.merge(user_defined_cols, on='gene id', how='left'),
+        summary_view,
         label = "Summary Table",
         page_size = 20,
         show_column_summaries=False,
@@ -3,18 +3,36 @@ import marimo
 __generated_with = "0.23.1"
 app = marimo.App(width="medium", app_title="Fragment Analysis Library Pooling")
 
-
-@app.cell
-def _():
+with app.setup:
     import io
+    import altair as alt
     import marimo as mo
-    import matplotlib.pyplot as plt
     import numpy as np
     import pandas as pd
     import re
-    from sklearn.linear_model import LinearRegression
-    import statsmodels.formula.api as smf
+    from statistics import NormalDist
+
+    SMEAR_COLUMNS = ['Well', 'Sample ID', 'Range', 'ng/µL', '% Total', 'nmole/L', 'Avg. Size', '%CV', 'Size Threshold (b.p.)', 'DQN']
+    # the label and measurement columns have fixed types; the sizes are left to inference so that whole numbers stay integers
+    SMEAR_DTYPES = {'Well': str, 'Sample ID': str, 'Range': str, 'ng/uL': float, 'ng/µL': float, '% Total': float, 'nmole/L': float, '%CV': float, 'DQN': float}
+    # a fragment analyzer size interval such as `100 bp to 450 bp`
+    RANGE_BOUNDS = re.compile(r"\s*([\d,]+)\s*bp\s+to\s+([\d,]+)\s*bp\s*", re.IGNORECASE)
+    NATURAL_KEY = re.compile('([0-9]+)')
+    # a custom size window such as `450-800` or `450 to 800`
+    WINDOW_SPAN = re.compile(r"(\d+)\s*(?:-|to)\s*(\d+)", re.IGNORECASE)
+    # the imputation fits every response against the sample concentration with each model, in this order
+    MODELS = ['Log Model', 'Linear Model']
+    RESPONSES = ['Corrected ng/µL', 'Est. nM', 'Avg.Size']
+    INTERVAL_LEVEL = 0.95
+    # the models the imputation can use: each line family against the log then the linear concentration, then a monotone fit
+    CANDIDATES = ['Log Model', 'Linear Model', 'Log Huber', 'Linear Huber', 'Log Theil-Sen', 'Linear Theil-Sen', 'Log WLS', 'Linear WLS', 'Isotonic']
+    AUTOMATIC = 'Automatic (leave-one-out CV)'
+    # a line through two samples has no residual, so no leave-one-out error or interval
+    MIN_FITTED = 3
 
+
+@app.cell
+def _():
     example_table = mo.md("""
     | Well | Sample ID | Range             | ng/uL  | % Total | nmole/L | Avg. Size | %CV   | Size Threshold (b.p.) | DQN |
     |:-----|:----------|:------------------|:-------|:--------|:--------|:----------|:------|:----------------------|:----|
@@ -34,57 +52,767 @@ def _():
     | sample_1 | 1.2 |
     | sample_2 | 0.74 |
     """)
-    return (
-        LinearRegression,
-        example_table,
-        io,
-        mo,
-        np,
-        pd,
-        plt,
-        re,
-        sample_table,
+    return example_table, sample_table
+
+
+@app.function
+def natural_sort(l):
+    convert = lambda text: int(text) if text.isdigit() else text.lower()
+    alphanum_key = lambda key: [convert(c) for c in NATURAL_KEY.split(key)]
+    return sorted(l, key=alphanum_key)
+
+
+@app.function
+def interval_bounds(labels):
+    """The lower and upper bp bounds of `Range` labels such as `100 bp to 450 bp`, NaN for labels of another form"""
+    matches = [RANGE_BOUNDS.fullmatch(str(label)) for label in labels]
+    return pd.DataFrame(
+        {
+            'lo': [float(match[1].replace(',', '')) if match else np.nan for match in matches],
+            'hi': [float(match[2].replace(',', '')) if match else np.nan for match in matches]
+        },
+        index = pd.Index(labels, name='Range')
     )
 
 
-@app.cell
-def _(pd, re):
-    def process_sample(group, target_identifier, all_intervals):
-        target_row = group[group['Range'] == target_identifier].iloc[0]
-        corrected_sum = group[group['Range'] != all_intervals[0]]['ng/µL'].sum()
-        target_conc = target_row['ng/µL']
-        target_size = target_row['Avg. Size']
-        sample_id = target_row['Sample ID']
-        corrected_smear = target_conc/corrected_sum
-        quant = target_row['concentration (ng/µL)']
-        nM = (quant * corrected_smear) / (target_size * 660) * 1000000
-        return pd.Series(
-            {
-            'Sample ID': sample_id,
+@app.function
+def order_ranges(ranges):
+    """`Range` labels as a categorical ordered by their bp bounds, with labels of another form naturally sorted after them"""
+    labels = natural_sort(set(ranges.dropna()))
+    bounds = interval_bounds(labels)
+    order = np.lexsort((bounds['hi'].to_numpy(), bounds['lo'].to_numpy()))
+    return pd.Categorical(ranges, categories=[labels[i] for i in order], ordered=True)
+
+
+@app.function
+@mo.lru_cache(maxsize=16)
+def read_smear_export(contents):
+    """Read a fragment analyzer smear export, or return None if it does not have the expected columns.
+
+    Rows with a `Sample ID` that only appears once in the file (e.g. a ladder) are dropped, and
+    `Range` becomes a categorical ordered by size, so its intervals are sorted once per upload.
+    Results are cached by the uploaded bytes.
+    """
+    try:
+        df = pd.read_csv(io.BytesIO(contents), dtype=SMEAR_DTYPES)
+    except (ValueError, UnicodeDecodeError):
+        return None
+    df.dropna(how='all', axis=1, inplace=True)
+    df.rename(columns = {'ng/uL' : 'ng/µL'}, inplace = True)
+    if sorted(df.columns) != sorted(SMEAR_COLUMNS):
+        return None
+    df = df[df['Sample ID'].duplicated(keep=False)]
+    return df.assign(Range=order_ranges(df['Range']))
+
+
+@app.function
+def smear_matrix(df):
+    """Arrange a smear table as a well × interval matrix, so that intervals are selected by position rather than by label.
+
+    Returns a dict of the `wells`, the `Sample ID` of each well, the `ranges` in size order with
+    their `lo` and `hi` bp bounds (-1 for labels of another form), and the `ng/µL` and
+    `Avg. Size` of every well in every interval, NaN where a well lacks the interval. When a
+    well lists an interval twice, its first row is kept.
+    """
+    ranges = df['Range'].array if isinstance(df['Range'].dtype, pd.CategoricalDtype) else order_ranges(df['Range'])
+    well_codes, wells = pd.factorize(df['Well'])
+    range_codes = ranges.codes
+    rows = np.flatnonzero((well_codes >= 0) & (range_codes >= 0))
+    _, first = np.unique(well_codes[rows] * len(ranges.categories) + range_codes[rows], return_index=True)
+    rows = rows[first]
+    _, well_rows = np.unique(well_codes[rows], return_index=True)
+
+    bounds = interval_bounds(ranges.categories)
+    matrix = {
+        'wells': pd.Index(wells, name='Well'),
+        'Sample ID': df['Sample ID'].to_numpy()[rows[well_rows]],
+        'ranges': pd.Index(ranges.categories, name='Range'),
+        'lo': bounds['lo'].fillna(-1).to_numpy(dtype=np.int64),
+        'hi': bounds['hi'].fillna(-1).to_numpy(dtype=np.int64)
+    }
+    for column in ('ng/µL', 'Avg. Size'):
+        values = np.full((len(wells), len(ranges.categories)), np.nan)
+        values[well_codes[rows], range_codes[rows]] = df[column].to_numpy(dtype=float)[rows]
+        matrix[column] = values
+    return matrix
+
+
+@app.function
+def interval_columns(matrix, labels):
+    """The columns of the interval `labels` in a `smear_matrix`, raising a ValueError that names any interval it does not have"""
+    columns = matrix['ranges'].get_indexer(labels)
+    unknown = [f"`{label}`" for label, column in zip(labels, columns) if column < 0]
+    if unknown:
+        plural = "s" if len(unknown) > 1 else ""
+        raise ValueError(f"Unknown interval{plural} {', '.join(unknown)}; the intervals are {', '.join(matrix['ranges'])}")
+    return columns
+
+
+@app.function
+def window_fractions(matrix, targets, excluded):
+    """The target window of every well and its share of the well's total concentration, leaving out the `excluded` interval.
+
+    `targets` is an interval label or a list of them, whose concentrations are summed into one
+    window. The average size of a window of several intervals is the one that keeps its molarity
+    equal to the sum of theirs.
+    """
+    targets = [targets] if isinstance(targets, str) else list(targets)
+    columns = interval_columns(matrix, targets)
+    counted = np.ones(len(matrix['ranges']), dtype=bool)
+    counted[interval_columns(matrix, [excluded])] = False
+    concentrations = matrix['ng/µL']
+    sizes = matrix['Avg. Size']
+
+    corrected_sum = np.nansum(concentrations[:, counted], axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if len(columns) == 1:
+            target_conc = concentrations[:, columns[0]]
+            target_size = sizes[:, columns[0]]
+        else:
+            window = concentrations[:, columns]
+            # a well without any of the intervals has no window, rather than an empty one
+            present = ~np.isnan(window).all(axis=1)
+            target_conc = np.where(present, np.nansum(window, axis=1), np.nan)
+            target_size = target_conc / np.nansum(window / sizes[:, columns], axis=1)
+        corrected_smear = target_conc / corrected_sum
+    # whole-number sizes stay integers
+    if np.isfinite(target_size).all() and (target_size == np.round(target_size)).all():
+        target_size = target_size.astype(np.int64)
+    return pd.DataFrame(
+        {
+            'Sample ID': matrix['Sample ID'],
             'Avg.Size': target_size,
-            '% of Total Conc.': round(corrected_smear * 100,1),
-            'Window ng/µL': round(target_conc,3),
+            'Window ng/µL': target_conc,
+            'Corrected smear': corrected_smear
+        },
+        index = matrix['wells']
+    )
+
+
+@app.function
+@mo.lru_cache(maxsize=16)
+def read_trace_export(contents):
+    """Read a fragment analyzer electropherogram export, or return None if it is not one.
+
+    The export has a size column (e.g. `Size (bp)`) and one RFU column per well, named like
+    `A1: sample_1`. Returns a dict of the `Well` and `Sample ID` of every column, the sizes
+    in increasing order and an RFU matrix of one row per well. Ladder wells are dropped.
+    Results are cached by the uploaded bytes.
+    """
+    try:
+        df = pd.read_csv(io.BytesIO(contents))
+    except (ValueError, UnicodeDecodeError):
+        return None
+    df.dropna(how='all', axis=1, inplace=True)
+    size_columns = [column for column in df.columns if str(column).strip().lower().startswith('size')]
+    if len(size_columns) != 1 or len(df.columns) < 2:
+        return None
+    df = df.dropna(subset=size_columns).sort_values(size_columns[0], kind='stable')
+
+    columns = df.columns.drop(size_columns[0])
+    labels = [str(column).partition(':') for column in columns]
+    wells = np.array([well.strip() for well, _, _ in labels])
+    samples = np.array([sample.strip() or well.strip() for well, _, sample in labels])
+    try:
+        rfu = df[columns].to_numpy(dtype=float).T
+        sizes = df[size_columns[0]].to_numpy(dtype=float)
+    except ValueError:
+        return None
+    keep = np.char.lower(samples.astype(str)) != 'ladder'
+    return {'Well': wells[keep], 'Sample ID': samples[keep], 'Size (bp)': sizes, 'RFU': np.nan_to_num(rfu[keep])}
+
+
+@app.function
+def parse_windows(text):
+    """The `(lo, hi)` bp windows of a text such as `10-100, 100-450, 450-800`, skipping empty ones"""
+    windows = [(int(lo), int(hi)) for lo, hi in WINDOW_SPAN.findall(text)]
+    return [(lo, hi) for lo, hi in windows if lo < hi]
+
+
+@app.function
+def window_areas(sizes, values, lo, hi):
+    """The trapezoidal integrals of traces between each pair of `lo`-`hi` bounds, for all traces and windows at once.
+
+    `values` holds one trace per row, possibly stacked along leading axes, and `sizes` is
+    either their shared size grid or one grid per row. The traces are taken as linear between
+    grid points and as zero outside their grid, so windows may start or end anywhere.
+    Returns an array of `values`' leading shape with one column per window.
+    """
+    shared = np.ndim(sizes) == 1
+    sizes = np.broadcast_to(sizes, values.shape[-2:])
+    lo, hi = np.asarray(lo, dtype=float), np.asarray(hi, dtype=float)
+    segments = np.diff(sizes, axis=-1) * (values[..., 1:] + values[..., :-1]) / 2
+    cumulative = np.concatenate([np.zeros(values.shape[:-1] + (1,)), np.cumsum(segments, axis=-1)], axis=-1)
+
+    def cumulative_at(bounds):
+        bounds = np.clip(bounds[None, :], sizes[:, :1], sizes[:, -1:])
+        # the grid point at or after each bound, and the one before it
+        right = np.searchsorted(sizes[0], bounds) if shared else (sizes[:, None, :] < bounds[:, :, None]).sum(axis=-1)
+        right = np.clip(right, 1, sizes.shape[-1] - 1)
+        rows = np.arange(sizes.shape[0])[:, None]
+        left_size, right_size = sizes[rows, right - 1], sizes[rows, right]
+        left_value, right_value = values[..., rows, right - 1], values[..., rows, right]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fraction = np.nan_to_num((bounds - left_size) / (right_size - left_size))
+        bound_value = left_value + fraction * (right_value - left_value)
+        return cumulative[..., rows, right - 1] + (left_value + bound_value) / 2 * (bounds - left_size)
+
+    return cumulative_at(hi) - cumulative_at(lo)
+
+
+@app.function
+def trace_calibration(trace, matrix):
+    """The ng/µL per unit of trace area of every well of a trace, from the total ng/µL of the same well in a `smear_matrix`.
+
+    The trace of each well is integrated over the span of the exported intervals. Wells that are
+    missing from the export keep a factor of 1.
+    """
+    parsed = matrix['lo'] >= 0
+    if not parsed.any():
+        return np.ones(len(trace['Well']))
+    areas = window_areas(trace['Size (bp)'], trace['RFU'], [matrix['lo'][parsed].min()], [matrix['hi'][parsed].max()])[:, 0]
+    totals = pd.Series(np.nansum(matrix['ng/µL'][:, parsed], axis=1), index=matrix['wells'])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        factors = totals.reindex(trace['Well']).to_numpy() / areas
+    return np.where(np.isfinite(factors) & (areas > 0), factors, 1.0)
+
+
+@app.function
+def trace_windows(trace, windows, calibration=None):
+    """Integrate the traces of every well over custom bp windows into a smear table like the instrument's export.
+
+    Gives the ng/µL, % Total, nmole/L and Avg. Size of each well in each `(lo, hi)` window. The
+    average size is weighted by mass, and the molarity sums the moles of every size. Without a
+    `calibration` (see `trace_calibration`), the trace is taken as ng/µL per bp.
+    """
+    sizes, rfu = trace['Size (bp)'], trace['RFU']
+    lo, hi = np.array([window[0] for window in windows]), np.array([window[1] for window in windows])
+    scale = np.ones(len(rfu)) if calibration is None else calibration
+    with np.errstate(divide='ignore', invalid='ignore'):
+        integrands = np.stack([rfu, rfu * sizes, np.where(sizes > 0, rfu / sizes, 0)])
+        mass, moment, moles = window_areas(sizes, integrands, lo, hi)
+        total = window_areas(sizes, rfu, [sizes.min()], [sizes.max()])
+        percent = mass / total * 100
+        avg_size = moment / mass
+    labels = [f"{window_lo} bp to {window_hi} bp" for window_lo, window_hi in windows]
+    df = pd.DataFrame(
+        {
+            'Well': np.repeat(trace['Well'], len(windows)),
+            'Sample ID': np.repeat(trace['Sample ID'], len(windows)),
+            'Range': np.tile(labels, len(rfu)),
+            'ng/µL': (mass * scale[:, None]).ravel(),
+            '% Total': np.round(percent, 1).ravel(),
+            'nmole/L': (moles * scale[:, None] / 660 * 1000000).ravel(),
+            'Avg. Size': np.round(avg_size).ravel()
+        }
+    )
+    return df.assign(Range=order_ranges(df['Range']))
+
+
+@app.function
+def join_concentrations(windows, quants):
+    """Add the quantified concentration of each well's sample to the output of `window_fractions`"""
+    concentrations = quants.drop_duplicates('Sample ID').set_index('Sample ID')['concentration (ng/µL)']
+    return windows.assign(**{'Sample ng/µL': windows['Sample ID'].map(concentrations).to_numpy(dtype=float)})
+
+
+@app.function
+def scale_concentrations(joined):
+    """The smear-corrected concentration and molarity of every well, from the output of `join_concentrations`"""
+    corrected_smear = joined['Corrected smear'].to_numpy()
+    target_size = joined['Avg.Size'].to_numpy()
+    quant = joined['Sample ng/µL'].to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        nM = (quant * corrected_smear) / (target_size * 660) * 1000000
+    return pd.DataFrame(
+        {
+            'Sample ID': joined['Sample ID'].to_numpy(),
+            'Avg.Size': np.round(target_size, 1),
+            '% of Total Conc.': np.round(corrected_smear * 100, 1),
+            'Window ng/µL': np.round(joined['Window ng/µL'].to_numpy(), 3),
             'Sample ng/µL': quant,
-            'Est. nM': round(nM, 2),
-            'Corrected ng/µL': round(quant * corrected_smear,3)
-        })
+            'Est. nM': np.round(nM, 2),
+            'Corrected ng/µL': np.round(quant * corrected_smear, 3)
+        },
+        index = joined.index
+    )
+
+
+@app.function
+def interval_responses(matrix, excluded, quants):
+    """The smear-scaled responses of every well with each interval of a `smear_matrix` as its target, in one pass.
+
+    Returns the quantified concentration of every well and its RESPONSES shaped well × interval ×
+    response. The slice of an interval holds the same values as the RESPONSES columns of
+    `scale_concentrations(join_concentrations(window_fractions(matrix, interval, excluded), quants))`.
+    """
+    counted = np.ones(len(matrix['ranges']), dtype=bool)
+    counted[interval_columns(matrix, [excluded])] = False
+    concentrations = matrix['ng/µL']
+    sizes = matrix['Avg. Size']
+    quant = join_concentrations(pd.DataFrame({'Sample ID': matrix['Sample ID']}), quants)['Sample ng/µL'].to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corrected_smear = concentrations / np.nansum(concentrations[:, counted], axis=1)[:, None]
+        nM = (quant[:, None] * corrected_smear) / (sizes * 660) * 1000000
+    return quant, np.stack([np.round(quant[:, None] * corrected_smear, 3), np.round(nM, 2), np.round(sizes, 1)], axis=-1)
+
+
+@app.function
+def design_matrices(x):
+    """The intercept and slope columns of the log and linear models for the concentrations `x`, stacked in the order of MODELS"""
+    x = np.asarray(x, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.stack([np.column_stack([np.ones_like(x), np.log(x)]), np.column_stack([np.ones_like(x), x])])
+
+
+@app.function
+def fit_models(x, y):
+    """Fit every column of `y` against the concentrations `x` with both models in one batched least-squares solve.
+
+    Returns the coefficients, shaped model × (intercept, slope) × response, and the R² of every
+    model and response. Predictions for new concentrations are `design_matrices(x) @ coefficients`.
+    """
+    design = design_matrices(x)
+    coefficients = np.linalg.pinv(design) @ y
+    residuals = y - design @ coefficients
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r2 = 1 - (residuals ** 2).sum(axis=1) / ((y - y.mean(axis=0)) ** 2).sum(axis=0)
+    return coefficients, r2
+
+
+@app.function
+def t_quantile(p, dof):
+    """The `p` quantile of Student's t distribution with `dof` degrees of freedom.
+
+    Up to 30 degrees of freedom, the quantile is solved exactly from the closed-form t distribution
+    of an integer `dof` (Abramowitz & Stegun 26.7.3-4). Beyond that it uses the Cornish-Fisher
+    expansion around the normal quantile, which is within 1e-5 of the exact value there, so that
+    the app does not need scipy.
+    """
+    if dof < 1:
+        return np.nan
+    if dof <= 30 and dof == int(dof):
+        if p == 0.5:
+            return 0.0
+        dof = int(dof)
+        # P(|T| < sqrt(dof) tan(theta)) is a finite series in theta, increasing from 0 to 1 over (0, pi/2)
+        target = abs(2 * p - 1)
+        low, high = 0.0, np.pi / 2
+        for _ in range(100):
+            theta = (low + high) / 2
+            cos = np.cos(theta)
+            term, series = 1.0, 1.0
+            for power in range(2, dof - 1, 2):
+                term *= power / (power + 1) if dof % 2 else (power - 1) / power
+                series += term * cos ** power
+            if dof % 2:
+                probability = 2 / np.pi * (theta + (np.sin(theta) * cos * series if dof > 1 else 0))
+            else:
+                probability = np.sin(theta) * series
+            low, high = (theta, high) if probability < target else (low, theta)
+        return np.copysign(np.sqrt(dof) * np.tan((low + high) / 2), p - 0.5)
+    z = NormalDist().inv_cdf(p)
+    return (
+        z
+        + (z ** 3 + z) / (4 * dof)
+        + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * dof ** 2)
+        + (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / (384 * dof ** 3)
+        + (79 * z ** 9 + 776 * z ** 7 + 1482 * z ** 5 - 1920 * z ** 3 - 945 * z) / (92160 * dof ** 4)
+    )
+
+
+@app.function
+def prediction_intervals(x, y, x_new, level=0.95):
+    """The fitted values of both models at the concentrations `x_new`, with the half-widths of their confidence and prediction intervals.
+
+    The intervals are the analytic ones of ordinary least squares, from the residual variance of
+    each fit and the leverage of each new concentration. All arrays are shaped
+    model × sample × response.
+    """
+    design = design_matrices(x)
+    pseudo_inverse = np.linalg.pinv(design)
+    coefficients = pseudo_inverse @ y
+    dof = len(x) - design.shape[-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variance = ((y - design @ coefficients) ** 2).sum(axis=1) / dof
+    new = design_matrices(x_new)
+    # x₀ᵀ(XᵀX)⁻¹x₀ for every new concentration, with (XᵀX)⁻¹ = X⁺(X⁺)ᵀ
+    leverage = np.einsum('kmi,kij,kmj->km', new, pseudo_inverse @ pseudo_inverse.transpose(0, 2, 1), new)[:, :, None]
+    t = t_quantile((1 + level) / 2, dof)
+    with np.errstate(invalid='ignore'):
+        confidence = t * np.sqrt(variance[:, None, :] * leverage)
+        prediction = t * np.sqrt(variance[:, None, :] * (1 + leverage))
+    return new @ coefficients, confidence, prediction
+
+
+@app.function
+def bootstrap_coefficients(x, y, resamples, seed=0):
+    """Refit both models to `resamples` bootstrap resamples of the rows of `x` and `y` in one batched solve.
+
+    Returns the coefficients shaped model × resample × (intercept, slope) × response.
+    """
+    rows = np.random.default_rng(seed).integers(0, len(x), (resamples, len(x)))
+    return np.linalg.pinv(design_matrices(x)[:, rows]) @ y[rows]
+
+
+@app.function
+def bootstrap_intervals(coefficients, x_new, level=0.95, chunk=256):
+    """The percentile intervals of the bootstrap fits of `bootstrap_coefficients` at the concentrations `x_new`.
+
+    Returns the lower and upper bounds, each shaped model × sample × response. The new samples
+    are predicted `chunk` at a time to bound the memory of the resample × sample predictions.
+    """
+    new = design_matrices(x_new)
+    bounds = np.empty((2, new.shape[0], len(new[0]), coefficients.shape[-1]))
+    for start in range(0, len(new[0]), chunk):
+        predictions = new[:, None, start:start + chunk] @ coefficients
+        bounds[:, :, start:start + chunk] = np.quantile(predictions, [(1 - level) / 2, (1 + level) / 2], axis=1)
+    return bounds[0], bounds[1]
+
+
+@app.function
+def weighted_lines(t, y, weights):
+    """Weighted least-squares lines of every column of `y` against each row of the regressors `t`.
+
+    `t` is shaped transform × sample, `y` sample × response (or transform × sample × response
+    to fit each transform to its own responses) and `weights` transform × sample × response. Returns the intercepts and slopes, each transform × response, and the leverage
+    of every sample in its fit, which gives the leave-one-out residuals `residual / (1 - leverage)`.
+    """
+    t = t[:, :, None]
+    total = weights.sum(axis=1, keepdims=True)
+    t_mean = (weights * t).sum(axis=1, keepdims=True) / total
+    y_mean = (weights * y).sum(axis=1, keepdims=True) / total
+    spread = (weights * (t - t_mean) ** 2).sum(axis=1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = (weights * (t - t_mean) * (y - y_mean)).sum(axis=1, keepdims=True) / spread
+        leverage = weights * (1 / total + (t - t_mean) ** 2 / spread)
+    return (y_mean - slope * t_mean)[:, 0], slope[:, 0], leverage
+
+
+@app.function
+def huber_lines(t, y, k=1.345, iterations=50):
+    """Huber-robust lines of every column of `y` against each row of `t`, by iteratively reweighted least squares.
+
+    Residuals beyond `k` robust standard deviations (from the median absolute deviation) are
+    down-weighted. Returns the intercepts, slopes and final weights, the weights shaped like
+    those of `weighted_lines`.
+    """
+    weights = np.ones((len(t), *y.shape))
+    for _ in range(iterations):
+        intercept, slope, _ = weighted_lines(t, y, weights)
+        residuals = y - (intercept[:, None] + slope[:, None] * t[:, :, None])
+        scale = np.median(np.abs(residuals - np.median(residuals, axis=1, keepdims=True)), axis=1, keepdims=True) / 0.6745
+        with np.errstate(divide='ignore', invalid='ignore'):
+            updated = np.nan_to_num(np.minimum(1, k * scale / np.abs(residuals)), nan=1.0)
+        converged = np.allclose(updated, weights, atol=1e-8)
+        weights = updated
+        if converged:
+            break
+    intercept, slope, _ = weighted_lines(t, y, weights)
+    return intercept, slope, weights
+
+
+@app.function
+def variance_weights(t, y):
+    """Weights for feasible weighted least squares: the inverse of a residual variance that changes log-linearly with `t`"""
+    intercept, slope, _ = weighted_lines(t, y, np.ones((len(t), *y.shape)))
+    squared = (y - (intercept[:, None] + slope[:, None] * t[:, :, None])) ** 2
+    # a floor keeps exactly fitted samples from getting log(0)
+    log_variance = np.log(squared + 1e-12 * squared.mean(axis=1, keepdims=True) + 1e-300)
+    variance_intercept, variance_slope, _ = weighted_lines(t, log_variance, np.ones_like(log_variance))
+    weights = np.exp(-(variance_intercept[:, None] + variance_slope[:, None] * t[:, :, None]))
+    return weights / weights.mean(axis=1, keepdims=True)
+
+
+@app.function
+def theil_sen_lines(t, y, leave_out=False):
+    """Theil-Sen lines of every column of `y` against each row of `t`: the median slope of all sample pairs and the median intercept.
+
+    With `leave_out`, also returns the residual of every sample under the line fitted without it.
+    Leaving a sample out removes its pairs from the sorted slopes, so the median of the others is
+    found by rank rather than by sorting again for every sample.
+    """
+    n = len(y)
+    first, second = np.triu_indices(n, 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slopes = (y[second] - y[first]) / (t[:, second] - t[:, first])[:, :, None]
+    slopes[~np.isfinite(slopes)] = np.nan
+    slope = np.nanmedian(slopes, axis=1)
+    intercept = np.nanmedian(y - slope[:, None] * t[:, :, None], axis=1)
+    if not leave_out:
+        return intercept, slope
+
+    # the sorted slopes, with undefined ones (tied concentrations) last, and the rank of every pair
+    order = np.argsort(slopes, axis=1)
+    sorted_slopes = np.take_along_axis(slopes, order, axis=1)
+    ranks = np.empty_like(order)
+    np.put_along_axis(ranks, order, np.arange(len(first))[None, :, None], axis=1)
+    valid = np.isfinite(slopes).sum(axis=1)[:, None, None]
+    # the ranks of the pairs of every sample, shaped transform × sample × pair × response
+    endpoints = np.concatenate([first, second]).argsort(kind='stable')
+    sample_pairs = np.tile(np.arange(len(first)), 2)[endpoints].reshape(n, n - 1)
+    removed = np.sort(ranks[:, sample_pairs], axis=2)
+    remaining = valid[..., 0] - (removed < valid).sum(axis=2)
+
+    def kept_at(rank):
+        # the smallest position whose count of kept slopes before it equals `rank`
+        position = rank
+        while True:
+            updated = rank + (removed <= position[:, :, None]).sum(axis=2)
+            if (updated == position).all():
+                return np.take_along_axis(sorted_slopes, np.minimum(position, len(first) - 1), axis=1)
+            position = updated
+
+    with np.errstate(invalid='ignore'):
+        loo_slope = np.where(remaining > 0, (kept_at((remaining - 1) // 2) + kept_at(remaining // 2)) / 2, np.nan)
+    offsets = y[None, None] - loo_slope[:, :, None] * t[:, None, :, None]
+    offsets[:, np.arange(n), np.arange(n)] = np.nan
+    loo_intercept = np.nanmedian(offsets, axis=2)
+    return intercept, slope, y - (loo_intercept + loo_slope * t[:, :, None])
+
+
+@app.function
+def isotonic_fit(x, y):
+    """Monotone fit of `y` against `x` by pool-adjacent-violators, increasing or decreasing as the data trend.
+
+    Tied concentrations are averaged first. Returns the sorted unique concentrations and the fitted
+    value at each, which are linearly interpolated (and held flat beyond the ends) to predict.
+    """
+    knots, inverse, counts = np.unique(x, return_inverse=True, return_counts=True)
+    means = np.bincount(inverse, weights=y) / counts
+    decreasing = np.cov(knots, means)[0, 1] < 0 if len(knots) > 1 else False
+    values, weights, sizes = [], [], []
+    for value, weight in zip(-means if decreasing else means, counts):
+        values.append(value)
+        weights.append(weight)
+        sizes.append(1)
+        while len(values) > 1 and values[-2] > values[-1]:
+            weight = weights[-2] + weights[-1]
+            values[-2:] = [(values[-2] * weights[-2] + values[-1] * weights[-1]) / weight]
+            weights[-2:] = [weight]
+            sizes[-2:] = [sizes[-2] + sizes[-1]]
+    fitted = np.repeat(values, sizes)
+    return knots, -fitted if decreasing else fitted
+
+
+@app.function
+@mo.lru_cache(maxsize=16)
+def fit_candidates(x, y):
+    """Fit every model of CANDIDATES to every response column of `y` and compute their leave-one-out residuals.
+
+    Lines use the closed-form leave-one-out residuals of a weighted least-squares fit, holding the
+    Huber and variance weights fixed; Theil-Sen and isotonic fits are refitted without each
+    sample. The inputs follow from the smear file, the concentration file and the target range,
+    so the fits are cached by them and switching models or going back to a target range is free.
+    """
+    t = design_matrices(x)[:, :, 1]
+    ones = np.ones((len(t), *y.shape))
+    ols = weighted_lines(t, y, ones)
+    huber_intercept, huber_slope, huber_weights = huber_lines(t, y)
+    huber = (huber_intercept, huber_slope, weighted_lines(t, y, huber_weights)[2])
+    wls = weighted_lines(t, y, variance_weights(t, y))
+    theil_sen_intercept, theil_sen_slope, theil_sen_residuals = theil_sen_lines(t, y, leave_out=True)
+
+    intercepts, slopes, loo = [], [], []
+    for intercept, slope, leverage in (ols, huber, wls):
+        residuals = y - (intercept[:, None] + slope[:, None] * t[:, :, None])
+        intercepts.append(intercept)
+        slopes.append(slope)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            loo.append(residuals / (1 - leverage))
+    intercepts.insert(2, theil_sen_intercept)
+    slopes.insert(2, theil_sen_slope)
+    loo.insert(2, theil_sen_residuals)
+
+    isotonic = [isotonic_fit(x, column) for column in y.T]
+    isotonic_loo = np.empty(y.shape)
+    for sample in range(len(x)):
+        kept = np.arange(len(x)) != sample
+        for column in range(y.shape[1]):
+            knots, values = isotonic_fit(x[kept], y[kept, column])
+            isotonic_loo[sample, column] = y[sample, column] - np.interp(x[sample], knots, values)
+    return {
+        # lines are ordered family by family, each fitted to the log then the linear concentration
+        'intercept': np.concatenate(intercepts),
+        'slope': np.concatenate(slopes),
+        'isotonic': isotonic,
+        'loo': np.concatenate([*loo, isotonic_loo[None]])
+    }
 
-    def natural_sort(l): 
-        convert = lambda text: int(text) if text.isdigit() else text.lower()
-        alphanum_key = lambda key: [convert(c) for c in re.split('([0-9]+)', key)]
-        return sorted(l, key=alphanum_key)
 
-    return natural_sort, process_sample
+@app.function
+def predict_candidates(fits, x_new):
+    """The predictions of every model of CANDIDATES at the concentrations `x_new`, shaped candidate × sample × response"""
+    t = design_matrices(x_new)[:, :, 1]
+    lines = fits['intercept'][:, None] + fits['slope'][:, None] * np.tile(t, (len(fits['intercept']) // len(t), 1))[:, :, None]
+    isotonic = np.column_stack([np.interp(x_new, knots, values) for knots, values in fits['isotonic']])
+    return np.concatenate([lines, isotonic[None]])
+
+
+@app.function
+def loo_rmse(fits):
+    """The leave-one-out root mean squared error of every candidate and response, shaped candidate × response"""
+    return np.sqrt(np.nanmean(fits['loo'] ** 2, axis=1))
+
+
+@app.function
+def selected_intervals(fits, selected, x_new, level=0.95, ols=None, bootstrap=None):
+    """The predictions and intervals of the candidate `selected` for each response, shaped sample × response.
+
+    Prediction intervals add the `level` quantiles of the candidate's leave-one-out residuals to
+    its predictions. For the OLS candidates, the analytic intervals of `prediction_intervals`
+    (`ols`) and the bootstrap bounds of `bootstrap_intervals` (`bootstrap`) are used where given;
+    other candidates have no confidence or bootstrap interval. Returns the predictions and the
+    lower and upper bounds of the confidence, prediction and bootstrap intervals, each stacked
+    on a first axis of two.
+    """
+    responses = np.arange(len(selected))
+    fitted = predict_candidates(fits, x_new)[selected, :, responses].T
+    quantiles = np.nanquantile(fits['loo'][selected, :, responses], [(1 - level) / 2, (1 + level) / 2], axis=1)
+    prediction = fitted[None] + quantiles[:, None, :]
+    confidence = np.full(prediction.shape, np.nan)
+    bounds = np.full(prediction.shape, np.nan)
+    for response, candidate in enumerate(selected):
+        if candidate >= len(MODELS):
+            continue
+        if ols is not None:
+            _, confidence_width, prediction_width = ols
+            confidence[:, :, response] = fitted[:, response] + np.array([-1, 1])[:, None] * confidence_width[candidate, :, response]
+            prediction[:, :, response] = fitted[:, response] + np.array([-1, 1])[:, None] * prediction_width[candidate, :, response]
+        if bootstrap is not None:
+            bounds[:, :, response] = bootstrap[0][candidate, :, response], bootstrap[1][candidate, :, response]
+    return fitted, confidence, prediction, bounds
+
+
+@app.function
+def missing_intervals(selected, bootstrap=False):
+    """A warning naming the responses whose `selected` candidate has no confidence or bootstrap interval, or None when all of them have both.
+
+    Only the OLS candidates have these intervals. When `bootstrap` resamples were requested but no
+    response uses an OLS candidate, the warning also says that the bootstrap was skipped.
+    """
+    lacking = [f"{response} ({CANDIDATES[candidate]})" for response, candidate in zip(RESPONSES, selected) if candidate >= len(MODELS)]
+    if not lacking:
+        return None
+    intervals = "confidence and bootstrap intervals" if bootstrap else "confidence intervals"
+    warning = f"{', '.join(lacking)} {'is' if len(lacking) == 1 else 'are'} imputed with models that have no {intervals}, only prediction intervals from their leave-one-out residuals; those columns are empty."
+    if bootstrap and len(lacking) == len(RESPONSES):
+        warning += " The bootstrap was skipped, since it only refits the Log Model and the Linear Model."
+    return warning
+
+
+@app.function
+def uncertainty_table(samples, x_new, fitted, confidence, prediction, bootstrap):
+    """One row per imputed sample with every response and the bounds of its intervals, from the output of `selected_intervals`.
+
+    Intervals that the selected models do not have are NaN; `missing_intervals` names them.
+    """
+    columns = {'Sample': samples, 'Quant ng/µL': x_new}
+    for column, response in enumerate(RESPONSES):
+        columns[response] = fitted[:, column]
+        for name, bounds in (('CI', confidence), ('PI', prediction), ('bootstrap', bootstrap)):
+            columns[f'{response} {name} low'] = bounds[0][:, column]
+            columns[f'{response} {name} high'] = bounds[1][:, column]
+    return pd.DataFrame(columns).round(3)
+
+
+@app.function
+def compare_intervals(quant, responses, ranges, x_new, min_concentration=0.2):
+    """Fit the candidates with each interval of `interval_responses` as the target and summarize the intervals side by side.
+
+    Each interval is fitted like a single target range of the app, with the samples below
+    `min_concentration` left out and every response imputed by the candidate with the smallest
+    leave-one-out error. The fits go through the cache of `fit_candidates`, so a target range
+    compared here is not refitted when it is selected afterwards.
+
+    Args:
+        quant (np.ndarray): Quantified concentration of every analyzed well
+        responses (np.ndarray): The responses, shaped well × interval × response
+        ranges (list[str]): Interval labels, in the order of the second axis of `responses`
+        x_new (np.ndarray): Concentrations of the libraries to impute
+        min_concentration (float): Wells below this ng/µL are left out of the fits
+
+    Returns:
+        tuple[pd.DataFrame, pd.DataFrame]: One row per interval with its fit and imputation summary, and the imputed molarity of every library (row) with every interval (column)
+    """
+    rows = []
+    molarity = {}
+    nM = RESPONSES.index('Est. nM')
+    for column, interval in enumerate(ranges):
+        y = responses[:, column]
+        fitted = (quant >= min_concentration) & (quant > 0) & ~np.isnan(y).any(axis=1)
+        row = {'Range': interval, 'Fitted samples': int(fitted.sum())}
+        if fitted.sum() >= MIN_FITTED:
+            fits = fit_candidates(quant[fitted], y[fitted])
+            error = loo_rmse(fits)
+            selected = np.argmin(np.where(np.isnan(error), np.inf, error), axis=0)
+            imputed = predict_candidates(fits, x_new)[selected, :, np.arange(len(RESPONSES))].T
+            molarity[interval] = imputed[:, nM].round(2)
+            for response, candidate in zip(RESPONSES, selected):
+                row[f'{response} model'] = CANDIDATES[candidate]
+                row[f'{response} LOO RMSE'] = round(error[candidate, RESPONSES.index(response)], 3)
+            row['Median nM'] = round(np.median(imputed[:, nM]), 2)
+            row['Obvious dropouts'] = int((imputed[:, nM] <= 0).sum())
+            row['Likely dropouts'] = int(((imputed[:, nM] > 0) & (imputed[:, nM] < 0.3)).sum())
+        rows.append(row)
+    return pd.DataFrame(rows), pd.DataFrame(molarity)
+
+
+@app.function
+def diagnostic_chart(measured, x_new, predictions, r2):
+    """Plot every response against the sample concentration: the smear data and the predictions of both models for the libraries to impute.
+
+    The panels share one table of the plotted points, attached once to the whole chart rather
+    than to each panel, and the browser renders the spec.
+
+    Args:
+        measured (pd.DataFrame): The smear-scaled table, with `Sample ng/µL` and the responses
+        x_new (np.ndarray): Concentrations of the libraries to impute
+        predictions (np.ndarray): Predictions of `fit_models`, shaped model × sample × response
+        r2 (np.ndarray): R² of `fit_models`, shaped model × response
+
+    Returns:
+        alt.VConcatChart: One panel per response
+    """
+    # plotted under their axis titles, since Vega reads the dot of `Avg.Size` as a nested field
+    panels = [
+        ('Concentration', 'Smear-Corrected ng/µL', ['dodgerblue', 'lightsteelblue']),
+        ('Molarity', 'Estimated nM', ['darkseagreen', 'lightsteelblue']),
+        ('Average Fragment Size', 'Average Fragment Length', ['#009999', '#99d6d6'])
+    ]
+    labels = dict(zip(RESPONSES, [label for _, label, _ in panels]))
+    points = pd.concat([
+        measured[['Sample ng/µL', *RESPONSES]].rename(columns = labels).assign(Series = 'Smear Data'),
+        *[pd.DataFrame(predictions[model], columns = list(labels.values())).assign(**{'Sample ng/µL': x_new, 'Series': name}) for model, name in enumerate(MODELS)]
+    ], ignore_index = True)
+    series = ['Smear Data', *MODELS]
+    base = alt.Chart().mark_point(size = 20, opacity = 0.8).encode(x = alt.X('Sample ng/µL:Q', title = 'Sample ng/µL'))
+    charts = []
+    for (title, label, colors), (log_r2, linear_r2) in zip(panels, r2.T):
+        charts.append(base.encode(
+            y = alt.Y(f'{label}:Q', title = label, scale = alt.Scale(domainMin = 0)),
+            stroke = alt.Stroke('Series:N', scale = alt.Scale(domain = series, range = ['black', *colors]), title = None),
+            # the smear data are filled, the log model hollow and the linear model filled in a light shade
+            fill = alt.Fill('Series:N', scale = alt.Scale(domain = series, range = ['black', 'transparent', colors[1]]), legend = None),
+            tooltip = ['Series:N', 'Sample ng/µL:Q', f'{label}:Q']
+        ).properties(title = f"{title} (Log R² = {log_r2:.3f} | Linear R² = {linear_r2:.3f})", width = 700, height = 160))
+    return alt.vconcat(*charts, data = points).resolve_scale(stroke = 'independent', fill = 'independent')
 
 
 @app.cell
-def _(mo):
+def _():
     file_import = mo.ui.file(
         kind="area",
         filetypes = [".csv", ".CSV", ".Csv"],
         label = "Import smear CSV"
     )
 
+    trace_import = mo.ui.file(
+        kind="area",
+        filetypes = [".csv", ".CSV", ".Csv"],
+        label = "Optional: import the electropherogram (size/RFU) CSV to integrate custom size windows"
+    )
+
     samples_import = mo.ui.file(
         kind="area",
         filetypes = [".csv", ".CSV", ".Csv"],
@@ -93,18 +821,31 @@ def _(mo):
 
     sampleheaders = mo.ui.switch(value= True, label = "Headers in Sample file")
 
-    LogorLinear = mo.ui.radio(["Linear Model", "Log Model"], value = "Log Model", label = "Choose a model to use for imputation", inline = True)
-    return LogorLinear, file_import, sampleheaders, samples_import
+    model_choice = mo.ui.dropdown([AUTOMATIC, *CANDIDATES], value = AUTOMATIC, label = "Choose a model to use for imputation")
+    min_concentration = mo.ui.number(start = 0, stop = 100, step = 0.05, value = 0.2, label = "Leave samples below this ng/µL out of the fit")
+    bootstrap_resamples = mo.ui.number(start = 0, stop = 10000, step = 500, value = 0, label = "Bootstrap resamples of the OLS models (0 for the analytic intervals only)")
+    compare_all = mo.ui.switch(value = False, label = "Compare every interval as the target range")
+    return (
+        bootstrap_resamples,
+        compare_all,
+        file_import,
+        min_concentration,
+        model_choice,
+        sampleheaders,
+        samples_import,
+        trace_import,
+    )
 
 
 @app.cell
-def _(file_import, mo, sampleheaders, samples_import):
+def _(file_import, sampleheaders, samples_import, trace_import):
     mo.sidebar(
         [
             mo.md('# Smear-Imputed Molarity\nThis worksheet scales the concentration/molarity of samples with the proportional to your target fragment interval as determined by fragment (smear) analysis.'),
             mo.vstack([mo.md("### Sample concentrations"),samples_import, sampleheaders]),
             mo.md("### Smear Analysis"),
-            file_import
+            file_import,
+            trace_import
         ],
         footer = mo.md('<img src="public/gih_logo.png" width="200" />\n\nMade with ❤️ for 🧬')
     )
@@ -112,7 +853,7 @@ def _(file_import, mo, sampleheaders, samples_import):
 
 
 @app.cell
-def _(mo, sample_table, samples_import):
+def _(sample_table, samples_import):
     if not samples_import.value:
         import_text = mo.vstack([
             mo.md("""## ▷ Import Sample Concentrations
@@ -128,7 +869,7 @@ def _(mo, sample_table, samples_import):
 
 
 @app.cell
-def _(io, mo, pd, sampleheaders, samples_import):
+def _(sampleheaders, samples_import):
     mo.stop(
         not samples_import.value,
         mo.md("/// admonition| Sample file required\n\nCannot proceed until the file is uploaded\n///")
@@ -156,10 +897,10 @@ def _(io, mo, pd, sampleheaders, samples_import):
 
 
 @app.cell
-def _(example_table, file_import, mo):
+def _(example_table, file_import):
     smearnotes = {
         "🔍︎ Example Fragment Analyzer CSV File": example_table,
-        "⚠️ Notes and Considerations" : mo.md("**First row skipped**: Be aware that the first interval (sorted alphanumerically) of each sample, usually 10bp-100bp, is skipped in the calculations below.\n\n**Singletons skipped**: Rows with a `Sample ID` that only appears once are removed (e.g. a ladder, samples from a different run).\n\n**Consistency**: The target range is expected to be consistent across all samples.")}
+        "⚠️ Notes and Considerations" : mo.md("**First row skipped**: Be aware that the first (smallest) interval of each sample, usually 10bp-100bp, is skipped in the calculations below.\n\n**Singletons skipped**: Rows with a `Sample ID` that only appears once are removed (e.g. a ladder, samples from a different run).\n\n**Consistency**: The target range is expected to be consistent across all samples.\n\n**Custom size windows**: With an electropherogram file, the windows are integrated from the traces instead of using the intervals of the export. The ng/µL of each well is calibrated against the export's total for the well of the same name.")}
 
     if not file_import.value:
         smeartext = mo.vstack([
@@ -177,18 +918,15 @@ def _(example_table, file_import, mo):
 
 
 @app.cell
-def _(file_import, io, mo, pd):
+def _(file_import):
     mo.stop(
         not file_import.value,
         mo.md("/// admonition| Smear analysis file required\n\nCannot proceed until the file is uploaded\n///")
     )
 
-    df = pd.read_csv(io.BytesIO(file_import.value[0].contents))
-    df.dropna(how='all', axis=1, inplace=True)
-    df.rename(columns = {'ng/uL' : 'ng/µL'}, inplace = True)
-    df = df[df['Sample ID'].duplicated(keep=False)]
+    df = read_smear_export(file_import.value[0].contents)
     mo.stop(
-        sorted(list(df.columns)) != sorted(['Well', 'Sample ID', 'Range', 'ng/µL', '% Total', 'nmole/L','Avg. Size', '%CV', 'Size Threshold (b.p.)', 'DQN']),
+        df is None,
         output= mo.md("""
         /// error| Unrecognized input file
 
@@ -203,9 +941,43 @@ def _(file_import, io, mo, pd):
 
 
 @app.cell
-def _(df, mo, natural_sort, sampdf):
-    intervals = natural_sort(set(df['Range']))
-    target_range = mo.ui.radio(intervals, value = intervals[-2], inline = True)
+def _(df, trace_import):
+    export_matrix = smear_matrix(df)
+    trace = None
+    if trace_import.value:
+        trace = read_trace_export(trace_import.value[0].contents)
+        mo.stop(
+            trace is None,
+            mo.md(f"""
+        /// error| Unrecognized trace file
+
+        `{trace_import.value[0].name}` could not be read. The electropherogram file is expected to have a `Size (bp)` column and one RFU column per well, named like `A1: sample_1`.
+        ///
+        """)
+        )
+    custom_windows = mo.ui.text(
+        value = ", ".join(f"{lo}-{hi}" for lo, hi in zip(export_matrix['lo'], export_matrix['hi']) if lo >= 0),
+        label = "Size windows (bp) to integrate from the traces: ",
+        full_width = True
+    )
+    return custom_windows, export_matrix, trace
+
+
+@app.cell
+def _(custom_windows, export_matrix, trace):
+    if trace is None:
+        matrix = export_matrix
+    else:
+        _windows = parse_windows(custom_windows.value)
+        mo.stop(not _windows, mo.md("/// admonition| Size windows required\n\nEnter the windows to integrate, e.g. `10-100, 100-450, 450-800`\n///"))
+        matrix = smear_matrix(trace_windows(trace, _windows, trace_calibration(trace, export_matrix)))
+    intervals = list(matrix['ranges'])
+    return intervals, matrix
+
+
+@app.cell
+def _(intervals, sampdf):
+    target_range = mo.ui.multiselect(intervals, value = intervals[-2:-1] or intervals, label = "Several intervals are merged into one window")
 
     colnames = mo.ui.array([
         mo.ui.dropdown(options=list(sampdf.columns), label=f"Sample Names"),
@@ -213,16 +985,24 @@ def _(df, mo, natural_sort, sampdf):
     ],
         label = "Column Names"
     )
-    return colnames, intervals, target_range
+    return colnames, target_range
 
 
 @app.cell
-def _(colnames, file_import, mo, samples_import, target_range):
+def _(
+    colnames,
+    custom_windows,
+    file_import,
+    samples_import,
+    target_range,
+    trace,
+):
     mo.stop(not file_import.value or not samples_import.value)
 
     mo.vstack([
         mo.md(f"### {'▷' if any([not i.value for i in colnames]) else '✅'} Configure Imports\nColumns in sample-concentration file:"),
         mo.hstack(colnames, justify="start"),
+        *([custom_windows] if trace is not None else []),
         mo.md("Target genomic size range for the samples:"),
         target_range
     ])
@@ -236,9 +1016,9 @@ def _(colnames, file_import, samples_import):
 
 
 @app.cell
-def _(colnames, df, imports_finished, mo, sampdf):
+def _(colnames, df, imports_finished, sampdf):
     mo.stop(imports_finished)
-    quants_df = sampdf[[colnames[0].value, colnames[1].value]].rename(columns={colnames[0].value: 'Sample ID', colnames[1].value: 'concentration (ng/µL)'})
+    quants_df = sampdf[[colnames[0].value, colnames[1].value]].rename(columns={colnames[0].value: 'Sample ID', colnames[1].value: 'concentration (ng/µL)'}).astype({'Sample ID': str})
 
     lib_id = list(set(quants_df['Sample ID']))
     id_err = False
@@ -260,7 +1040,7 @@ def _(colnames, df, imports_finished, mo, sampdf):
 
 
 @app.cell
-def _(df, file_import, id_err, imports_finished, mo):
+def _(df, file_import, id_err, imports_finished):
     mo.stop(imports_finished or id_err)
     mo.accordion({
         "View Smear Data": mo.ui.table(
@@ -279,29 +1059,12 @@ def _(df, file_import, id_err, imports_finished, mo):
 
 
 @app.cell
-def _(
-    df,
-    id_err,
-    imports_finished,
-    intervals,
-    mo,
-    pd,
-    process_sample,
-    quants_df,
-    target_range,
-):
+def _(id_err, imports_finished, intervals, matrix, quants_df, target_range):
     mo.stop(imports_finished or id_err)
+    mo.stop(not target_range.value, mo.md("/// admonition| Target range required\n\nSelect at least one interval\n///"))
 
-    n_rows = pd.DataFrame(df.groupby('Sample ID').size(),columns=['sample'])
-
-    df_with_conc = df.merge(
-        quants_df,
-        left_on='Sample ID',
-        right_on='Sample ID',
-        how="left"
-    )
-
-    calc_table = df_with_conc.groupby('Well', sort = False).apply(lambda group: process_sample(group, target_range.value, intervals), include_groups=False)
+    windows = window_fractions(matrix, target_range.value, intervals[0])
+    calc_table = scale_concentrations(join_concentrations(windows, quants_df))
     mo.ui.table(
         calc_table,
         pagination = False,
@@ -309,155 +1072,180 @@ def _(
         show_column_summaries = False,
         show_data_types = False,
         freeze_columns_left = ["Sample ID"],
-        label = f"## Scaled Concentrations\n\nThis table scales the concentrations you input above with the proportion of the sample with the target `Range` **{target_range.value}**"
+        label = f"## Scaled Concentrations\n\nThis table scales the concentrations you input above with the proportion of the sample with the target `Range` **{' + '.join(target_range.value)}**"
     )
     return (calc_table,)
 
 
 @app.cell
-def _(id_err, imports_finished, mo):
+def _(id_err, imports_finished):
     mo.stop(imports_finished or id_err)
 
-    mo.md("----\n## Model and Scale\nUsing the data above, we can create a fitted model (non-linear least squares via log(x)) that will help scale the concentrations of the other libraries made alongside these that were not submitted for fragment analysis.")
+    mo.md("----\n## Model and Scale\nUsing the data above, we can create a fitted model that will help scale the concentrations of the other libraries made alongside these that were not submitted for fragment analysis. Least-squares, robust (Huber, Theil-Sen), weighted and monotone (isotonic) models are fitted against the concentration or its log, and by default each value is imputed with the model that predicts left-out samples best.")
     return
 
 
 @app.cell
-def _(
-    LinearRegression,
-    calc_table,
-    id_err,
-    imports_finished,
-    mo,
-    np,
-    quants_df,
-):
+def _(calc_table, id_err, imports_finished, min_concentration, quants_df):
     mo.stop(imports_finished or id_err)
 
-    predict_table = calc_table[calc_table["Sample ng/µL"] >= 0.2]
-
-    x = np.log(predict_table["Sample ng/µL"].values).reshape(-1, 1)
-    x_linear = predict_table["Sample ng/µL"].values.reshape(-1, 1)
-    y = predict_table["Corrected ng/µL"].values
-    nMy = predict_table["Est. nM"].values
-    Sizey = predict_table["Avg.Size"].values
+    # the log models need positive concentrations, and samples without a target window have nothing to fit
+    _fitted = (calc_table["Sample ng/µL"] >= min_concentration.value) & (calc_table["Sample ng/µL"] > 0) & calc_table[RESPONSES].notna().all(axis=1)
+    predict_table = calc_table[_fitted]
+    excluded = list(calc_table.loc[~_fitted, "Sample ID"].astype(str))
+    mo.stop(
+        _fitted.sum() < MIN_FITTED,
+        mo.vstack([
+            mo.md(f"/// error| Too few samples to fit\n\nOnly {_fitted.sum()} of the {len(calc_table)} analyzed samples are at or above {min_concentration.value} ng/µL and have the target range, and the models need at least {MIN_FITTED}. Lower the cut-off or choose another target range.\n///"),
+            min_concentration
+        ])
+    )
+    fit_concentrations = predict_table["Sample ng/µL"].to_numpy(dtype=float)
+    # in C order like the slices of `compare_intervals`, since the cache of `fit_candidates` tells the memory layouts apart
+    fit_responses = np.ascontiguousarray(predict_table[RESPONSES].to_numpy(dtype=float))
+    coefficients, r2 = fit_models(fit_concentrations, fit_responses)
 
-    fit = LinearRegression().fit(x, y)
-    fitlinear = LinearRegression().fit(x_linear, y)
+    # Predict
+    x_seq = quants_df['concentration (ng/µL)'].values
+    predictions = design_matrices(x_seq) @ coefficients
+    return excluded, fit_concentrations, fit_responses, predictions, r2, x_seq
 
-    Molarityfit = LinearRegression().fit(x, nMy)
-    Molarityfitlinear = LinearRegression().fit(x_linear, nMy)
 
-    Sizefit = LinearRegression().fit(x, Sizey)
-    Sizefitlinear = LinearRegression().fit(x_linear, Sizey)
+@app.cell
+def _(calc_table, id_err, imports_finished, predictions, r2, x_seq):
+    mo.stop(imports_finished or id_err)
 
-    # Predict
-    x_seq = quants_df['concentration (ng/µL)'].values
+    mo.ui.altair_chart(diagnostic_chart(calc_table, x_seq, predictions, r2), chart_selection = False, legend_selection = False)
+    return
 
-    y_pred = fit.predict(np.log(x_seq).reshape(-1, 1))
-    y_pred_linear = fitlinear.predict(x_seq.reshape(-1, 1))
-    rsq = f"Log R² = {fit.score(x, y):.3f} | Linear R² = {fitlinear.score(x_linear, y):.3f}"
 
-    nMy_pred = Molarityfit.predict(np.log(x_seq).reshape(-1, 1))
-    nMy_pred_linear = Molarityfitlinear.predict(x_seq.reshape(-1, 1))
-    nM_rsq = f"Log R² = {Molarityfit.score(x, nMy):.3f} | Linear R² = {Molarityfitlinear.score(x_linear, nMy):.3f}"
+@app.cell
+def _(fit_concentrations, fit_responses):
+    candidate_fits = fit_candidates(fit_concentrations, fit_responses)
+    cv_error = loo_rmse(candidate_fits)
+    return candidate_fits, cv_error
 
-    size_pred = Sizefit.predict(np.log(x_seq).reshape(-1, 1))
-    size_pred_linear = Sizefitlinear.predict(x_seq.reshape(-1, 1))
-    size_rsq = f"Log R² = {Sizefit.score(x, Sizey):.3f} | Linear R² = {Sizefitlinear.score(x_linear, Sizey):.3f}"
 
-    return (
-        nM_rsq,
-        nMy_pred,
-        nMy_pred_linear,
-        rsq,
-        size_pred,
-        size_pred_linear,
-        size_rsq,
-        x_seq,
-        y_pred,
-        y_pred_linear,
-    )
+@app.cell
+def _(cv_error, model_choice):
+    if model_choice.value == AUTOMATIC:
+        selected = np.argmin(np.where(np.isnan(cv_error), np.inf, cv_error), axis=0)
+    else:
+        selected = np.full(len(RESPONSES), CANDIDATES.index(model_choice.value))
+    return (selected,)
 
 
 @app.cell
 def _(
-    calc_table,
+    bootstrap_resamples,
+    compare_all,
+    cv_error,
+    excluded,
     id_err,
     imports_finished,
-    mo,
-    nM_rsq,
-    nMy_pred,
-    nMy_pred_linear,
-    plt,
-    rsq,
-    size_pred,
-    size_pred_linear,
-    size_rsq,
-    x_seq,
-    y_pred,
-    y_pred_linear,
+    min_concentration,
+    model_choice,
+    selected,
 ):
     mo.stop(imports_finished or id_err)
 
-    fig, axes = plt.subplots(3,1,sharex=True, figsize=(11, 7))
-
-    # Plot on the first axes
-    axes[0].set_title(f"Concentration ({rsq})")
-    axes[0].scatter(calc_table["Sample ng/µL"], calc_table["Corrected ng/µL"], color="black", label="Smear Data")
-    axes[0].scatter(x_seq, y_pred, facecolors='none', edgecolors='dodgerblue', marker='.', label="Log Model")
-    axes[0].scatter(x_seq, y_pred_linear, facecolors='lightsteelblue', marker='.', edgecolors=None, label="Linear Model")
-    axes[0].set_xlabel("Sample ng/µL")
-    axes[0].set_ylabel("Smear-Corrected ng/µL")
-    axes[0].set_ylim(0, None)
-    axes[0].legend()
-
-    # Plot on the second axes
-    axes[1].set_title(f"Molarity ({nM_rsq})")
-    axes[1].scatter(calc_table["Sample ng/µL"], calc_table["Est. nM"], color="black", label="Smear Data")
-    axes[1].scatter(x_seq, nMy_pred, facecolors='none', edgecolors='darkseagreen', marker='.', label="Log Model")
-    axes[1].scatter(x_seq, nMy_pred_linear, facecolors='lightsteelblue', edgecolors=None, marker='.', label="Linear Model")
-    axes[1].set_xlabel("Sample ng/µL")
-    axes[1].set_ylabel("Estimated nM")
-    axes[1].set_ylim(0, None)
-    axes[1].legend()
-
-    # Plot on the third axes
-    axes[2].set_title(f"Average Fragment Size ({size_rsq})")
-    axes[2].scatter(calc_table["Sample ng/µL"], calc_table["Avg.Size"], color="black", label="Smear Data")
-    axes[2].scatter(x_seq, size_pred, facecolors='none', edgecolors='#009999', marker='.', label="Log Model")
-    axes[2].scatter(x_seq, size_pred_linear, facecolors='#99d6d6', edgecolors=None, marker='.', label="Linear Model")
-    axes[2].set_xlabel("Sample ng/µL")
-    axes[2].set_ylabel("Average Fragment Length")
-    axes[2].set_ylim(0, None)
-    axes[2].legend()
-
-    # 4. Use tight_layout to prevent label overlap
-    plt.tight_layout()
-    plt.gcf()
+    def bold_selected(row_id, column_name, value):
+        if column_name in RESPONSES and selected[RESPONSES.index(column_name)] == int(row_id):
+            return {"fontWeight": "bold"}
+        return {}
+
+    mo.vstack([
+        mo.hstack([model_choice, min_concentration, bootstrap_resamples, compare_all], justify = "start"),
+        mo.md(f"/// attention | {len(excluded)} sample{'s' if len(excluded) != 1 else ''} left out of the fit\n\nBelow {min_concentration.value} ng/µL or without the target range: {', '.join(excluded)}\n///") if excluded else "",
+        mo.accordion({
+            "View Leave-One-Out Errors of Every Model": mo.ui.table(
+                pd.DataFrame(cv_error, columns = RESPONSES).round(3).assign(Model = CANDIDATES)[["Model", *RESPONSES]],
+                label = "Root mean squared error of predicting each fitted sample from the others; the models in use are in bold",
+                show_data_types = False,
+                show_column_summaries = False,
+                selection = None,
+                pagination = False,
+                style_cell = bold_selected
+            )
+        })
+    ])
     return
 
 
 @app.cell
-def _(LogorLinear, id_err, imports_finished, mo):
-    mo.stop(imports_finished or id_err)
-    LogorLinear
+def _(
+    compare_all,
+    id_err,
+    imports_finished,
+    intervals,
+    matrix,
+    min_concentration,
+    quants_df,
+    x_seq,
+):
+    mo.stop(imports_finished or id_err or not compare_all.value)
+
+    with mo.status.spinner(title = f"Fitting the models with each of the {len(intervals)} intervals as the target range"):
+        _quant, _responses = interval_responses(matrix, intervals[0], quants_df)
+        interval_summary, interval_molarity = compare_intervals(_quant, _responses, intervals, x_seq, min_concentration.value)
+    mo.vstack([
+        mo.ui.table(
+            interval_summary,
+            label = "### Interval Comparison\n\nEvery interval fitted as the target range, each value imputed with the model of smallest leave-one-out error. These fits are kept, so selecting one of these intervals above does not refit it.",
+            show_data_types = False,
+            show_column_summaries = False,
+            selection = None,
+            pagination = False,
+            freeze_columns_left = ["Range"]
+        ),
+        mo.accordion({
+            "View Imputed nM with Every Interval": mo.ui.table(
+                interval_molarity.assign(Sample = quants_df['Sample ID'].values)[["Sample", *interval_molarity.columns]],
+                page_size = 24,
+                show_data_types = False,
+                show_column_summaries = False,
+                selection = None,
+                freeze_columns_left = ["Sample"]
+            )
+        })
+    ])
     return
 
 
+@app.cell
+def _(fit_concentrations, fit_responses, x_seq):
+    fitted, confidence, prediction = prediction_intervals(fit_concentrations, fit_responses, x_seq, INTERVAL_LEVEL)
+    return confidence, fitted, prediction
+
+
+@app.cell
+def _(bootstrap_resamples, fit_concentrations, fit_responses, selected, x_seq):
+    bootstrap = None
+    # only the OLS models are resampled, so there is nothing to refit when no response uses one
+    if bootstrap_resamples.value and (selected < len(MODELS)).any():
+        with mo.status.spinner(title = f"Refitting the models to {int(bootstrap_resamples.value)} resamples"):
+            bootstrap = bootstrap_intervals(bootstrap_coefficients(fit_concentrations, fit_responses, int(bootstrap_resamples.value)), x_seq, INTERVAL_LEVEL)
+    return (bootstrap,)
+
+
 @app.cell
 def _(
-    LogorLinear,
-    nMy_pred,
-    nMy_pred_linear,
-    pd,
+    bootstrap,
+    candidate_fits,
+    confidence,
+    fitted,
+    prediction,
     quants_df,
-    size_pred,
-    size_pred_linear,
+    selected,
     x_seq,
-    y_pred,
-    y_pred_linear,
 ):
+    imputed, *_bounds = selected_intervals(candidate_fits, selected, x_seq, INTERVAL_LEVEL, (fitted, confidence, prediction), bootstrap)
+    uncertainty = uncertainty_table(quants_df['Sample ID'].values, x_seq, imputed, *_bounds)
+    return imputed, uncertainty
+
+
+@app.cell
+def _(imputed, quants_df, uncertainty, x_seq):
     def warn_cell(row_id, column_name, value):
         # row_id is a string index; look up the target column value for this row
         try:
@@ -471,15 +1259,15 @@ def _(
             pass
         return {}
 
-    islog = LogorLinear.value == "Log Model"
-
     frag_scaled_concs = pd.DataFrame(
             {
                 "Sample" : quants_df['Sample ID'].values,
                 "Quant ng/µL": x_seq,
-                "Frag-Corrected ng/µL" : y_pred.round(2) if islog else y_pred_linear.round(2),
-                "Average Fragment Size": size_pred.round() if islog else size_pred_linear.round(),
-                "Estimated nM" : nMy_pred.round(2) if islog else nMy_pred_linear.round(2)
+                "Frag-Corrected ng/µL" : imputed[:, RESPONSES.index("Corrected ng/µL")].round(2),
+                "Average Fragment Size": imputed[:, RESPONSES.index("Avg.Size")].round(),
+                "Estimated nM" : imputed[:, RESPONSES.index("Est. nM")].round(2),
+                f"nM {INTERVAL_LEVEL:.0%} PI low" : uncertainty["Est. nM PI low"].round(2).values,
+                f"nM {INTERVAL_LEVEL:.0%} PI high" : uncertainty["Est. nM PI high"].round(2).values
             }
         )
 
@@ -487,19 +1275,33 @@ def _(
 
 
 @app.cell
-def _(frag_scaled_concs, mo, warn_cell):
+def _(bootstrap_resamples, frag_scaled_concs, selected, uncertainty, warn_cell):
     dropouts = sum([i <= 0 for i in frag_scaled_concs["Estimated nM"].values])
     likelydropouts = sum([(i > 0 and i < 0.3) for i in frag_scaled_concs["Estimated nM"].values])
+    # samples estimated above the dropout range whose prediction interval still reaches into it
+    uncertain = sum((frag_scaled_concs["Estimated nM"].values >= 0.3) & (uncertainty["Est. nM PI low"].values < 0.3))
+    _missing = missing_intervals(selected, bool(bootstrap_resamples.value))
 
     mo.vstack([
-        mo.md(f"Obvious dropouts: **{dropouts}** (red) | Likely dropouts: **{likelydropouts}** (orange)"),
+        mo.md(f"Obvious dropouts: **{dropouts}** (red) | Likely dropouts: **{likelydropouts}** (orange) | Possible dropouts within the {INTERVAL_LEVEL:.0%} prediction interval: **{uncertain}**"),
         mo.ui.table(
             frag_scaled_concs,
             page_size = 24,
             show_data_types=False,
             show_column_summaries=False,
             style_cell=warn_cell
-        )
+        ),
+        *([mo.md(f"/// attention | Intervals left out\n\n{_missing}\n///")] if _missing else []),
+        mo.accordion({
+            "View Intervals of Every Response": mo.ui.table(
+                uncertainty,
+                page_size = 24,
+                show_data_types = False,
+                show_column_summaries = False,
+                selection = None,
+                freeze_columns_left = ["Sample"]
+            )
+        })
     ])
     return
 
@@ -3,14 +3,28 @@ import marimo
 __generated_with = "0.23.1"
 app = marimo.App(width="medium", app_title="Smear-Scaled Concentrations")
 
-
-@app.cell
-def _():
+with app.setup:
+    from concurrent.futures import ThreadPoolExecutor
     import io
     import marimo as mo
+    import numpy as np
     import pandas as pd
+    from pathlib import Path
     import re
+    import sys
+
+    SMEAR_COLUMNS = ['Well', 'Sample ID', 'Range', 'ng/µL', '% Total', 'nmole/L', 'Avg. Size', '%CV', 'Size Threshold (b.p.)', 'DQN']
+    # the label and measurement columns have fixed types; the sizes are left to inference so that whole numbers stay integers
+    SMEAR_DTYPES = {'Well': str, 'Sample ID': str, 'Range': str, 'ng/uL': float, 'ng/µL': float, '% Total': float, 'nmole/L': float, '%CV': float, 'DQN': float}
+    # a fragment analyzer size interval such as `100 bp to 450 bp`
+    RANGE_BOUNDS = re.compile(r"\s*([\d,]+)\s*bp\s+to\s+([\d,]+)\s*bp\s*", re.IGNORECASE)
+    NATURAL_KEY = re.compile('([0-9]+)')
+    # a custom size window such as `450-800` or `450 to 800`
+    WINDOW_SPAN = re.compile(r"(\d+)\s*(?:-|to)\s*(\d+)", re.IGNORECASE)
+
 
+@app.cell
+def _():
     example_table = mo.md("""
     | Well | Sample ID | Range             | ng/uL  | % Total | nmole/L | Avg. Size | %CV   | Size Threshold (b.p.) | DQN |
     |:-----|:----------|:------------------|:-------|:--------|:--------|:----------|:------|:----------------------|:----|
@@ -23,15 +37,21 @@ def _():
     | F3   | sample_2  | 450 bp to 800 bp  | 3.5493 | 39.1    | 10.0215 | 583       | 16.55 | 300                   | 8.8 |
     | F3   | sample_2  | 800 bp to 5500 bp | 1.4898 | 16.4    | 1.9335  | 1268      | 44.82 | 300                   | 8.8 |
     """)
-    return example_table, io, mo, pd, re
+    return (example_table,)
 
 
 @app.cell
-def _(mo):
+def _():
     file_import = mo.ui.file(
         kind="area",
         filetypes = [".csv", ".CSV", ".Csv"],
-        label = "Import the fragment analysis CSV file here"
+        multiple = True,
+        label = "Import the fragment analysis CSV files here (one per plate)"
+    )
+    trace_import = mo.ui.file(
+        kind="area",
+        filetypes = [".csv", ".CSV", ".Csv"],
+        label = "Optional: import the electropherogram (size/RFU) CSV to integrate custom size windows"
     )
     target_pmol = mo.ui.slider(
         value = 15.0,
@@ -51,15 +71,16 @@ def _(mo):
         full_width = True,
         label = "Volume to elute in (µL)"
     )
-    return elution_vol, file_import, target_pmol
+    return elution_vol, file_import, target_pmol, trace_import
 
 
 @app.cell
-def _(elution_vol, file_import, mo, target_pmol):
+def _(elution_vol, file_import, target_pmol, trace_import):
     mo.sidebar(
         [
             mo.md('# Smear-Scaled Concentrations\nThis worksheet scales the concentration of your samples based on the proportion of representation of your target fragment interval as determined by fragment analysis.'),
             file_import,
+            trace_import,
             target_pmol,
             elution_vol
         ],
@@ -68,47 +89,361 @@ def _(elution_vol, file_import, mo, target_pmol):
     return
 
 
-@app.cell
-def _(pd, re):
-    def process_sample(group, target_identifier, all_intervals, picomoles):
-        target_row = group[group['Range'] == target_identifier].iloc[0]
-        corrected_sum = group[group['Range'] != all_intervals[0]]['ng/µL'].sum()
-        #group[group['Range'] != '10 to 100 bp']['ng/µL'].sum()
-        #corrected_sum = group['ng/µL'].iloc[1:].sum()
-        target_conc = target_row['ng/µL']
-        target_size = target_row['Avg. Size']
-        sample_id = target_row['Sample ID']
-        corrected_smear = target_conc/corrected_sum
-        quant = target_row['concentration (ng/µL)']
-        nM = (quant * corrected_smear) / (target_size * 660) * 1000000
-        if nM > 0:
-            vol_to_pool = picomoles / nM
+@app.function
+def natural_sort(l):
+    convert = lambda text: int(text) if text.isdigit() else text.lower()
+    alphanum_key = lambda key: [convert(c) for c in NATURAL_KEY.split(key)]
+    return sorted(l, key=alphanum_key)
+
+
+@app.function
+def interval_bounds(labels):
+    """The lower and upper bp bounds of `Range` labels such as `100 bp to 450 bp`, NaN for labels of another form"""
+    matches = [RANGE_BOUNDS.fullmatch(str(label)) for label in labels]
+    return pd.DataFrame(
+        {
+            'lo': [float(match[1].replace(',', '')) if match else np.nan for match in matches],
+            'hi': [float(match[2].replace(',', '')) if match else np.nan for match in matches]
+        },
+        index = pd.Index(labels, name='Range')
+    )
+
+
+@app.function
+def order_ranges(ranges):
+    """`Range` labels as a categorical ordered by their bp bounds, with labels of another form naturally sorted after them"""
+    labels = natural_sort(set(ranges.dropna()))
+    bounds = interval_bounds(labels)
+    order = np.lexsort((bounds['hi'].to_numpy(), bounds['lo'].to_numpy()))
+    return pd.Categorical(ranges, categories=[labels[i] for i in order], ordered=True)
+
+
+@app.function
+@mo.lru_cache(maxsize=16)
+def read_smear_export(contents):
+    """Read a fragment analyzer smear export, or return None if it does not have the expected columns.
+
+    Rows with a `Sample ID` that only appears once in the file (e.g. a ladder) are dropped, and
+    `Range` becomes a categorical ordered by size, so its intervals are sorted once per upload.
+    Results are cached by the uploaded bytes.
+    """
+    try:
+        df = pd.read_csv(io.BytesIO(contents), dtype=SMEAR_DTYPES)
+    except (ValueError, UnicodeDecodeError):
+        return None
+    df.dropna(how='all', axis=1, inplace=True)
+    df.rename(columns = {'ng/uL' : 'ng/µL'}, inplace = True)
+    if sorted(df.columns) != sorted(SMEAR_COLUMNS):
+        return None
+    df = df[df['Sample ID'].duplicated(keep=False)]
+    return df.assign(Range=order_ranges(df['Range']))
+
+
+@app.function
+def read_smear_runs(files):
+    """Read the smear exports of several runs concurrently and stack them with a `Run` column naming the file of each row.
+
+    `files` are `(name, contents)` pairs. Well names repeat from plate to plate, so with more than
+    one run every well is prefixed with its run. Returns the table and the names of the files
+    that were not recognized.
+    """
+    contents = [data for _, data in files]
+    if sys.platform == "emscripten" or len(files) < 2:
+        tables = [read_smear_export(data) for data in contents]
+    else:
+        with ThreadPoolExecutor() as pool:
+            tables = list(pool.map(read_smear_export, contents))
+    unrecognized = [name for (name, _), table in zip(files, tables) if table is None]
+
+    runs = []
+    for name, _ in files:
+        stem = run = Path(name).stem
+        # files with the same name from different folders still get distinct runs, also when a file is named like `plate (2)`
+        copy = 1
+        while run in runs:
+            copy += 1
+            run = f"{stem} ({copy})"
+        runs.append(run)
+    tagged = [table.assign(Run=run) for run, table in zip(runs, tables) if table is not None]
+    if not tagged:
+        return pd.DataFrame(columns = ['Run', *SMEAR_COLUMNS]), unrecognized
+    df = pd.concat(tagged, ignore_index=True)
+    df = df[['Run', *df.columns.drop('Run')]]
+    if len(tagged) > 1:
+        df['Well'] = df['Run'] + ' ' + df['Well'].astype(str)
+    # each file has its own intervals, so the ordered categories are merged
+    df['Range'] = order_ranges(df['Range'].astype(object))
+    return df, unrecognized
+
+
+@app.function
+def smear_matrix(df):
+    """Arrange a smear table as a well × interval matrix, so that intervals are selected by position rather than by label.
+
+    Returns a dict of the `wells`, the `Sample ID` of each well, the `ranges` in size order with
+    their `lo` and `hi` bp bounds (-1 for labels of another form), and the `ng/µL` and
+    `Avg. Size` of every well in every interval, NaN where a well lacks the interval. When a
+    well lists an interval twice, its first row is kept.
+    """
+    ranges = df['Range'].array if isinstance(df['Range'].dtype, pd.CategoricalDtype) else order_ranges(df['Range'])
+    well_codes, wells = pd.factorize(df['Well'])
+    range_codes = ranges.codes
+    rows = np.flatnonzero((well_codes >= 0) & (range_codes >= 0))
+    _, first = np.unique(well_codes[rows] * len(ranges.categories) + range_codes[rows], return_index=True)
+    rows = rows[first]
+    _, well_rows = np.unique(well_codes[rows], return_index=True)
+
+    bounds = interval_bounds(ranges.categories)
+    matrix = {
+        'wells': pd.Index(wells, name='Well'),
+        'Sample ID': df['Sample ID'].to_numpy()[rows[well_rows]],
+        'ranges': pd.Index(ranges.categories, name='Range'),
+        'lo': bounds['lo'].fillna(-1).to_numpy(dtype=np.int64),
+        'hi': bounds['hi'].fillna(-1).to_numpy(dtype=np.int64)
+    }
+    for column in ('ng/µL', 'Avg. Size'):
+        values = np.full((len(wells), len(ranges.categories)), np.nan)
+        values[well_codes[rows], range_codes[rows]] = df[column].to_numpy(dtype=float)[rows]
+        matrix[column] = values
+    return matrix
+
+
+@app.function
+def interval_columns(matrix, labels):
+    """The columns of the interval `labels` in a `smear_matrix`, raising a ValueError that names any interval it does not have"""
+    columns = matrix['ranges'].get_indexer(labels)
+    unknown = [f"`{label}`" for label, column in zip(labels, columns) if column < 0]
+    if unknown:
+        plural = "s" if len(unknown) > 1 else ""
+        raise ValueError(f"Unknown interval{plural} {', '.join(unknown)}; the intervals are {', '.join(matrix['ranges'])}")
+    return columns
+
+
+@app.function
+def window_fractions(matrix, targets, excluded):
+    """The target window of every well and its share of the well's total concentration, leaving out the `excluded` interval.
+
+    `targets` is an interval label or a list of them, whose concentrations are summed into one
+    window. The average size of a window of several intervals is the one that keeps its molarity
+    equal to the sum of theirs.
+    """
+    targets = [targets] if isinstance(targets, str) else list(targets)
+    columns = interval_columns(matrix, targets)
+    counted = np.ones(len(matrix['ranges']), dtype=bool)
+    counted[interval_columns(matrix, [excluded])] = False
+    concentrations = matrix['ng/µL']
+    sizes = matrix['Avg. Size']
+
+    corrected_sum = np.nansum(concentrations[:, counted], axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if len(columns) == 1:
+            target_conc = concentrations[:, columns[0]]
+            target_size = sizes[:, columns[0]]
         else:
-            vol_to_pool = 0
-        ng_primary_lib = quant * vol_to_pool
-        return pd.Series(
-            {
-            'Sample ID': sample_id,
+            window = concentrations[:, columns]
+            # a well without any of the intervals has no window, rather than an empty one
+            present = ~np.isnan(window).all(axis=1)
+            target_conc = np.where(present, np.nansum(window, axis=1), np.nan)
+            target_size = target_conc / np.nansum(window / sizes[:, columns], axis=1)
+        corrected_smear = target_conc / corrected_sum
+    # whole-number sizes stay integers
+    if np.isfinite(target_size).all() and (target_size == np.round(target_size)).all():
+        target_size = target_size.astype(np.int64)
+    return pd.DataFrame(
+        {
+            'Sample ID': matrix['Sample ID'],
             'Avg.Size': target_size,
-            '% of Total Conc.': round(corrected_smear * 100,1),
-            'Window ng/µL': round(target_conc,3),
+            'Window ng/µL': target_conc,
+            'Corrected smear': corrected_smear
+        },
+        index = matrix['wells']
+    )
+
+
+@app.function
+@mo.lru_cache(maxsize=16)
+def read_trace_export(contents):
+    """Read a fragment analyzer electropherogram export, or return None if it is not one.
+
+    The export has a size column (e.g. `Size (bp)`) and one RFU column per well, named like
+    `A1: sample_1`. Returns a dict of the `Well` and `Sample ID` of every column, the sizes
+    in increasing order and an RFU matrix of one row per well. Ladder wells are dropped.
+    Results are cached by the uploaded bytes.
+    """
+    try:
+        df = pd.read_csv(io.BytesIO(contents))
+    except (ValueError, UnicodeDecodeError):
+        return None
+    df.dropna(how='all', axis=1, inplace=True)
+    size_columns = [column for column in df.columns if str(column).strip().lower().startswith('size')]
+    if len(size_columns) != 1 or len(df.columns) < 2:
+        return None
+    df = df.dropna(subset=size_columns).sort_values(size_columns[0], kind='stable')
+
+    columns = df.columns.drop(size_columns[0])
+    labels = [str(column).partition(':') for column in columns]
+    wells = np.array([well.strip() for well, _, _ in labels])
+    samples = np.array([sample.strip() or well.strip() for well, _, sample in labels])
+    try:
+        rfu = df[columns].to_numpy(dtype=float).T
+        sizes = df[size_columns[0]].to_numpy(dtype=float)
+    except ValueError:
+        return None
+    keep = np.char.lower(samples.astype(str)) != 'ladder'
+    return {'Well': wells[keep], 'Sample ID': samples[keep], 'Size (bp)': sizes, 'RFU': np.nan_to_num(rfu[keep])}
+
+
+@app.function
+def parse_windows(text):
+    """The `(lo, hi)` bp windows of a text such as `10-100, 100-450, 450-800`, skipping empty ones"""
+    windows = [(int(lo), int(hi)) for lo, hi in WINDOW_SPAN.findall(text)]
+    return [(lo, hi) for lo, hi in windows if lo < hi]
+
+
+@app.function
+def window_areas(sizes, values, lo, hi):
+    """The trapezoidal integrals of traces between each pair of `lo`-`hi` bounds, for all traces and windows at once.
+
+    `values` holds one trace per row, possibly stacked along leading axes, and `sizes` is
+    either their shared size grid or one grid per row. The traces are taken as linear between
+    grid points and as zero outside their grid, so windows may start or end anywhere.
+    Returns an array of `values`' leading shape with one column per window.
+    """
+    shared = np.ndim(sizes) == 1
+    sizes = np.broadcast_to(sizes, values.shape[-2:])
+    lo, hi = np.asarray(lo, dtype=float), np.asarray(hi, dtype=float)
+    segments = np.diff(sizes, axis=-1) * (values[..., 1:] + values[..., :-1]) / 2
+    cumulative = np.concatenate([np.zeros(values.shape[:-1] + (1,)), np.cumsum(segments, axis=-1)], axis=-1)
+
+    def cumulative_at(bounds):
+        bounds = np.clip(bounds[None, :], sizes[:, :1], sizes[:, -1:])
+        # the grid point at or after each bound, and the one before it
+        right = np.searchsorted(sizes[0], bounds) if shared else (sizes[:, None, :] < bounds[:, :, None]).sum(axis=-1)
+        right = np.clip(right, 1, sizes.shape[-1] - 1)
+        rows = np.arange(sizes.shape[0])[:, None]
+        left_size, right_size = sizes[rows, right - 1], sizes[rows, right]
+        left_value, right_value = values[..., rows, right - 1], values[..., rows, right]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fraction = np.nan_to_num((bounds - left_size) / (right_size - left_size))
+        bound_value = left_value + fraction * (right_value - left_value)
+        return cumulative[..., rows, right - 1] + (left_value + bound_value) / 2 * (bounds - left_size)
+
+    return cumulative_at(hi) - cumulative_at(lo)
+
+
+@app.function
+def trace_calibration(trace, matrix):
+    """The ng/µL per unit of trace area of every well of a trace, from the total ng/µL of the same well in a `smear_matrix`.
+
+    The trace of each well is integrated over the span of the exported intervals. Wells that are
+    missing from the export keep a factor of 1.
+    """
+    parsed = matrix['lo'] >= 0
+    if not parsed.any():
+        return np.ones(len(trace['Well']))
+    areas = window_areas(trace['Size (bp)'], trace['RFU'], [matrix['lo'][parsed].min()], [matrix['hi'][parsed].max()])[:, 0]
+    totals = pd.Series(np.nansum(matrix['ng/µL'][:, parsed], axis=1), index=matrix['wells'])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        factors = totals.reindex(trace['Well']).to_numpy() / areas
+    return np.where(np.isfinite(factors) & (areas > 0), factors, 1.0)
+
+
+@app.function
+def trace_windows(trace, windows, calibration=None):
+    """Integrate the traces of every well over custom bp windows into a smear table like the instrument's export.
+
+    Gives the ng/µL, % Total, nmole/L and Avg. Size of each well in each `(lo, hi)` window. The
+    average size is weighted by mass, and the molarity sums the moles of every size. Without a
+    `calibration` (see `trace_calibration`), the trace is taken as ng/µL per bp.
+    """
+    sizes, rfu = trace['Size (bp)'], trace['RFU']
+    lo, hi = np.array([window[0] for window in windows]), np.array([window[1] for window in windows])
+    scale = np.ones(len(rfu)) if calibration is None else calibration
+    with np.errstate(divide='ignore', invalid='ignore'):
+        integrands = np.stack([rfu, rfu * sizes, np.where(sizes > 0, rfu / sizes, 0)])
+        mass, moment, moles = window_areas(sizes, integrands, lo, hi)
+        total = window_areas(sizes, rfu, [sizes.min()], [sizes.max()])
+        percent = mass / total * 100
+        avg_size = moment / mass
+    labels = [f"{window_lo} bp to {window_hi} bp" for window_lo, window_hi in windows]
+    df = pd.DataFrame(
+        {
+            'Well': np.repeat(trace['Well'], len(windows)),
+            'Sample ID': np.repeat(trace['Sample ID'], len(windows)),
+            'Range': np.tile(labels, len(rfu)),
+            'ng/µL': (mass * scale[:, None]).ravel(),
+            '% Total': np.round(percent, 1).ravel(),
+            'nmole/L': (moles * scale[:, None] / 660 * 1000000).ravel(),
+            'Avg. Size': np.round(avg_size).ravel()
+        }
+    )
+    return df.assign(Range=order_ranges(df['Range']))
+
+
+@app.function
+def join_concentrations(windows, quants):
+    """Add the quantified concentration of each well's sample to the output of `window_fractions`"""
+    concentrations = quants.drop_duplicates('Sample ID').set_index('Sample ID')['concentration (ng/µL)']
+    return windows.assign(**{'Sample ng/µL': windows['Sample ID'].map(concentrations).to_numpy(dtype=float)})
+
+
+@app.function
+def pool_volumes(joined, picomoles):
+    """The scaled concentration and the volume to pool of every well, from the output of `join_concentrations`"""
+    corrected_smear = joined['Corrected smear'].to_numpy()
+    target_size = joined['Avg.Size'].to_numpy()
+    quant = joined['Sample ng/µL'].to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        nM = (quant * corrected_smear) / (target_size * 660) * 1000000
+        vol_to_pool = np.where(nM > 0, picomoles / nM, 0)
+    ng_primary_lib = quant * vol_to_pool
+    return pd.DataFrame(
+        {
+            'Sample ID': joined['Sample ID'].to_numpy(),
+            'Avg.Size': np.round(target_size, 1),
+            '% of Total Conc.': np.round(corrected_smear * 100, 1),
+            'Window ng/µL': np.round(joined['Window ng/µL'].to_numpy(), 3),
             'Sample ng/µL': quant,
-            'Est. nM': round(nM, 2),
-            'Corrected ng/µL': round(quant * corrected_smear,3),
-            'Volume to Pool': round(vol_to_pool, 2),
-            'ng Primary Library': round(ng_primary_lib, 1)
-        })
+            'Est. nM': np.round(nM, 2),
+            'Corrected ng/µL': np.round(quant * corrected_smear, 3),
+            'Volume to Pool': np.round(vol_to_pool, 2),
+            'ng Primary Library': np.round(ng_primary_lib, 1)
+        },
+        index = joined.index
+    )
+
+
+@app.function
+def pool_samples(df, quants, target_identifier, all_intervals, picomoles):
+    """The scaled concentration and the volume to pool of every well, computed column-wise over all wells at once.
+
+    `target_identifier` is an interval or a list of intervals to merge, and the first of
+    `all_intervals` is left out of each well's total. The app runs the stages in separate cells,
+    so that each one only reruns when its own inputs change: moving the picomoles slider only
+    reruns `pool_volumes`.
+    """
+    windows = window_fractions(smear_matrix(df), target_identifier, all_intervals[0])
+    return pool_volumes(join_concentrations(windows, quants), picomoles)
 
-    def natural_sort(l):
-        convert = lambda text: int(text) if text.isdigit() else text.lower()
-        alphanum_key = lambda key: [convert(c) for c in re.split('([0-9]+)', key)]
-        return sorted(l, key=alphanum_key)
 
-    return natural_sort, process_sample
+@app.function
+def pooling_metrics(calc_table, picomoles, elution_volume):
+    """The totals of a pooling table: pool volume, mass, concentration and molarity before and after elution"""
+    total_vol = calc_table['Volume to Pool'].sum()
+    total_ng = calc_table['ng Primary Library'].sum()
+    total_pM = picomoles * len(calc_table.index)
+
+    pool_ngul = 0 if total_vol == 0 else round(total_ng / total_vol,1)
+    pool_uM = 0 if total_vol == 0 else total_pM / total_vol
+    recovery = round(pool_uM * total_vol / elution_volume, 2)
+    return pd.DataFrame({
+        "Metric" : ["Total Volume of Pool (µL)", "Total ng Across Pools", "Pool ng/µL", "Total pM across intervals", "µM Per Pool across intervals", "µM Per Pool assuming 100% recovery"],
+        "Value" : [round(total_vol,2), total_ng, round(pool_ngul,2) , total_pM, round(pool_uM,1), recovery]
+    })
 
 
 @app.cell
-def _(example_table, file_import, io, mo, pd):
+def _(example_table, file_import):
     mo.stop(
         not file_import.value,
         mo.md(f"""## Import Data
@@ -116,22 +451,19 @@ def _(example_table, file_import, io, mo, pd):
 
     {mo.accordion({
         "🔍︎ Example CSV File": example_table,
-        "⚠️ Notes and Considerations" : mo.md("**First row skipped**: Be aware that the first interval (sorted alphanumerically) of each sample, usually 10bp-100bp, is skipped in the calculations below.\n\n**Singletons skipped**: Rows with a `Sample ID` that only appears once are removed (e.g. a ladder, samples from a different run).\n\n**Consistency**: The target range is expected to be consistent across all samples.")
+        "⚠️ Notes and Considerations" : mo.md("**First row skipped**: Be aware that the first (smallest) interval of each sample, usually 10bp-100bp, is skipped in the calculations below.\n\n**Singletons skipped**: Rows with a `Sample ID` that only appears once in its file are removed (e.g. a ladder, samples from a different run).\n\n**Consistency**: The target range is expected to be consistent across all samples.\n\n**Multiple plates**: With more than one file, each well is prefixed with the name of its file. A `Sample ID` that appears on several plates has a single concentration.\n\n**Custom size windows**: With an electropherogram file, the windows are integrated from the traces instead of using the intervals of the export. The ng/µL of each well is calibrated against the export's total for the well of the same name.")
     })}
 
     /// admonition| Input file required\n///""")
     )
 
-    df = pd.read_csv(io.BytesIO(file_import.value[0].contents))
-    df.dropna(how='all', axis=1, inplace=True)
-    df.rename(columns = {'ng/uL' : 'ng/µL'}, inplace = True)
-    df = df[df['Sample ID'].duplicated(keep=False)]
+    df, _unrecognized = read_smear_runs([(file.name, file.contents) for file in file_import.value])
     mo.stop(
-        sorted(list(df.columns)) != sorted(['Well', 'Sample ID', 'Range', 'ng/µL', '% Total', 'nmole/L','Avg. Size', '%CV', 'Size Threshold (b.p.)', 'DQN']),
-        output= mo.md("""
+        len(_unrecognized) > 0,
+        output= mo.md(f"""
         /// error| Unrecognized input file
 
-        The input file for this worksheet is expected to have a specific format. It is expected to have these columns, regardless of order:
+        {", ".join(f"`{name}`" for name in _unrecognized)} could not be read. The input files for this worksheet are expected to have a specific format. They are expected to have these columns, regardless of order:
 
         |Well | Sample ID | Range | ng/µL | % Total | nmole/L | Avg. Size | %CV | Size Threshold (b.p.) | DQN |
         |:---|:---|:---|:---|:---|:---|:---|:---|:---|:---|
@@ -142,20 +474,19 @@ def _(example_table, file_import, io, mo, pd):
 
 
 @app.cell
-def _(df, mo, natural_sort):
+def _(df):
     sample_id = list(set(df['Sample ID']))
-    intervals = natural_sort(set(df['Range']))
     mo.accordion({
-        "⚠️ Notes and Considerations" : mo.md("**First row skipped**: Be aware that the first interval (sorted alphanumerically) of each sample, usually 10bp-100bp, is skipped in the calculations below.\n\n**Singletons skipped**: Rows with a `Sample ID` that only appears once are removed (e.g. a ladder, samples from a different run).\n\n**Consistency**: The target range is expected to be consistent across all samples.")
+        "⚠️ Notes and Considerations" : mo.md("**First row skipped**: Be aware that the first (smallest) interval of each sample, usually 10bp-100bp, is skipped in the calculations below.\n\n**Singletons skipped**: Rows with a `Sample ID` that only appears once in its file are removed (e.g. a ladder, samples from a different run).\n\n**Consistency**: The target range is expected to be consistent across all samples.\n\n**Multiple plates**: With more than one file, each well is prefixed with the name of its file. A `Sample ID` that appears on several plates has a single concentration.\n\n**Custom size windows**: With an electropherogram file, the windows are integrated from the traces instead of using the intervals of the export. The ng/µL of each well is calibrated against the export's total for the well of the same name.")
     })
-    return (intervals,)
+    return
 
 
 @app.cell
-def _(df, file_import, mo):
+def _(df, file_import):
     mo.ui.table(
         df,
-        label = f"##Smear Analysis\nFile: **{file_import.value[0].name}**",
+        label = f"##Smear Analysis\nFile{'s' if len(file_import.value) > 1 else ''}: **{', '.join(file.name for file in file_import.value)}**",
         show_column_summaries=False,
         freeze_columns_left=["Sample ID"],
         show_data_types = False,
@@ -167,8 +498,49 @@ def _(df, file_import, mo):
 
 
 @app.cell
-def _(intervals, mo):
-    target_range = mo.ui.radio(intervals, value = intervals[-2], inline = True, label="Target range for the samples: ")
+def _(df, trace_import):
+    export_matrix = smear_matrix(df)
+    trace = None
+    if trace_import.value:
+        trace = read_trace_export(trace_import.value[0].contents)
+        mo.stop(
+            trace is None,
+            mo.md(f"""
+        /// error| Unrecognized trace file
+
+        `{trace_import.value[0].name}` could not be read. The electropherogram file is expected to have a `Size (bp)` column and one RFU column per well, named like `A1: sample_1`.
+        ///
+        """)
+        )
+    custom_windows = mo.ui.text(
+        value = ", ".join(f"{lo}-{hi}" for lo, hi in zip(export_matrix['lo'], export_matrix['hi']) if lo >= 0),
+        label = "Size windows (bp) to integrate from the traces: ",
+        full_width = True
+    )
+    return custom_windows, export_matrix, trace
+
+
+@app.cell
+def _(custom_windows, trace):
+    custom_windows if trace is not None else None
+    return
+
+
+@app.cell
+def _(custom_windows, export_matrix, trace):
+    if trace is None:
+        matrix = export_matrix
+    else:
+        _windows = parse_windows(custom_windows.value)
+        mo.stop(not _windows, mo.md("/// admonition| Size windows required\n\nEnter the windows to integrate, e.g. `10-100, 100-450, 450-800`\n///"))
+        matrix = smear_matrix(trace_windows(trace, _windows, trace_calibration(trace, export_matrix)))
+    intervals = list(matrix['ranges'])
+    return intervals, matrix
+
+
+@app.cell
+def _(intervals):
+    target_range = mo.ui.multiselect(intervals, value = intervals[-2:-1] or intervals, label="Target range for the samples (several intervals are merged into one window): ")
     return (target_range,)
 
 
@@ -179,7 +551,7 @@ def _(target_range):
 
 
 @app.cell
-def _(df, mo, pd):
+def _(df):
     input_header = mo.md("##Sample Concentrations\nUsing this interactive form, input the concentrations for each sample in **ng/µL** (nanograms per microliter).")
 
     def unique(sequence):
@@ -202,26 +574,21 @@ def _(df, mo, pd):
 
 
 @app.cell
-def _(
-    df,
-    intervals,
-    mo,
-    pd,
-    process_sample,
-    quants_df,
-    target_pmol,
-    target_range,
-):
-    n_rows = pd.DataFrame(df.groupby('Sample ID').size(),columns=['sample'])
-
-    df_with_conc = df.merge(
-        quants_df.value,
-        left_on='Sample ID',
-        right_on='Sample ID',
-        how="left"
-    )
+def _(intervals, matrix, target_range):
+    mo.stop(not target_range.value, mo.md("/// admonition| Target range required\n\nSelect at least one interval\n///"))
+    windows = window_fractions(matrix, target_range.value, intervals[0])
+    return (windows,)
+
+
+@app.cell
+def _(quants_df, windows):
+    joined = join_concentrations(windows, quants_df.value)
+    return (joined,)
 
-    calc_table = df_with_conc.groupby('Well', sort = False).apply(lambda group: process_sample(group, target_range.value, intervals, target_pmol.value), include_groups=False)
+
+@app.cell
+def _(joined, target_pmol, target_range):
+    calc_table = pool_volumes(joined, target_pmol.value)
     mo.ui.table(
         calc_table,
         pagination = False,
@@ -229,21 +596,13 @@ def _(
         show_column_summaries = False,
         show_data_types = False,
         freeze_columns_left = ["Sample ID"],
-        label = f"## Scaled Concentrations\n\nThis table scales the concentrations you input above with the proportion of the sample with the target `Range` **{target_range.value}**"
+        label = f"## Scaled Concentrations\n\nThis table scales the concentrations you input above with the proportion of the sample with the target `Range` **{' + '.join(target_range.value)}**"
     )
     return (calc_table,)
 
 
 @app.cell
-def _(calc_table, elution_vol, mo, pd, target_pmol):
-    total_vol = calc_table['Volume to Pool'].sum()
-    total_ng = calc_table['ng Primary Library'].sum()
-    total_pM = target_pmol.value * len(calc_table.index)
-
-    pool_ngul = 0 if total_vol == 0 else round(total_ng / total_vol,1)
-    pool_uM = 0 if total_vol == 0 else total_pM / total_vol
-    recovery = round(pool_uM * total_vol / elution_vol.value, 2)
-
+def _(calc_table, elution_vol, target_pmol):
     def style_cell(_rowId, _columnName, value):
         if _columnName == "Value":
             return {"fontWeight": "bold"}
@@ -251,10 +610,7 @@ def _(calc_table, elution_vol, mo, pd, target_pmol):
 
     mo.hstack(
         [mo.ui.table(
-            pd.DataFrame({
-                "Metric" : ["Total Volume of Pool (µL)", "Total ng Across Pools", "Pool ng/µL", "Total pM across intervals", "µM Per Pool across intervals", "µM Per Pool assuming 100% recovery"],
-                "Value" : [round(total_vol,2), total_ng, round(pool_ngul,2) , total_pM, round(pool_uM,1), recovery]
-            }),
+            pooling_metrics(calc_table, target_pmol.value, elution_vol.value),
             label = "## Final Pooling Metrics",
             show_data_types = False,
             style_cell = style_cell,
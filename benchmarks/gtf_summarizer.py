@@ -0,0 +1,412 @@
+"""
+Benchmarks for the GTF Summarizer app.
+
+This script times the parsing and summarizing functions of `apps/GTF_summarizer.py` on a
+synthetic, Ensembl-style GTF file (or a RefSeq-style GFF3 file) and compares them to the implementations they replaced.
+
+The script can be run from the command line:
+    uv run benchmarks/gtf_summarizer.py parse --lines 1000000
+"""
+
+# /// script
+# requires-python = ">=3.13"
+# dependencies = [
+#     "marimo",
+#     "pandas==2.3.3",
+#     "pyarrow",
+#     "fire==0.7.0",
+#     "loguru==0.7.0"
+# ]
+# ///
+
+from concurrent.futures import ProcessPoolExecutor
+import gzip
+import io
+import multiprocessing
+import random
+import re
+import struct
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+from pathlib import Path
+
+import fire
+import pandas as pd
+
+from loguru import logger
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "apps"))
+import GTF_summarizer as gtf
+
+
+def synthetic_gtf(lines: int = 1_000_000, seed: int = 0) -> bytes:
+    """Generate an Ensembl-style GTF with gene, transcript, exon and CDS rows.
+
+    Args:
+        lines (int): Approximate number of feature rows to generate
+        seed (int): Seed for the random number generator
+
+    Returns:
+        bytes: The uncompressed GTF file contents
+    """
+    rng = random.Random(seed)
+    out = ["#!genome-build GRCh38.p14\n"]
+    n_lines = 0
+    n_genes = 0
+    while n_lines < lines:
+        n_genes += 1
+        seqname = rng.choice(["1", "2", "3", "X", "MT", "KI270728.1"])
+        start = rng.randint(1, 100_000_000)
+        end = start + rng.randint(1_000, 100_000)
+        strand = rng.choice("+-")
+        biotype = rng.choice(["protein_coding", "lncRNA", "miRNA", "snRNA"])
+        gene = f'gene_id "ENSG{n_genes:011d}"; gene_version "{rng.randint(1, 9)}"; gene_name "GENE{n_genes}"; gene_source "ensembl_havana"; gene_biotype "{biotype}";'
+        out.append(f"{seqname}\tensembl_havana\tgene\t{start}\t{end}\t.\t{strand}\t.\t{gene}\n")
+        n_lines += 1
+        for transcript in range(rng.randint(1, 4)):
+            attributes = f'{gene} transcript_id "ENST{n_genes:09d}{transcript:02d}"; transcript_version "1"; transcript_biotype "{biotype}"; tag "basic"; tag "Ensembl_canonical";'
+            out.append(f"{seqname}\thavana\ttranscript\t{start}\t{end}\t.\t{strand}\t.\t{attributes}\n")
+            n_lines += 1
+            position = start
+            for exon in range(rng.randint(1, 8)):
+                exon_start = position + rng.randint(0, 2_000)
+                exon_end = exon_start + rng.randint(50, 500)
+                position = exon_end
+                out.append(f'{seqname}\thavana\texon\t{exon_start}\t{exon_end}\t.\t{strand}\t.\t{attributes} exon_number "{exon + 1}"; exon_id "ENSE{n_genes:08d}{transcript}{exon}";\n')
+                out.append(f'{seqname}\thavana\tCDS\t{exon_start}\t{exon_end}\t.\t{strand}\t0\t{attributes} exon_number "{exon + 1}"; protein_id "ENSP{n_genes:09d}{transcript:02d}";\n')
+                n_lines += 2
+    return "".join(out).encode()
+
+
+def synthetic_gff3(lines: int = 1_000_000, seed: int = 0) -> bytes:
+    """Generate a RefSeq-style GFF3 with the same genes, transcripts, exons and CDS as `synthetic_gtf`.
+
+    Args:
+        lines (int): Approximate number of feature rows to generate
+        seed (int): Seed for the random number generator
+
+    Returns:
+        bytes: The uncompressed GFF3 file contents
+    """
+    out = ["##gff-version 3\n"]
+    for line in synthetic_gtf(lines, seed).decode().splitlines(keepends=True):
+        if line.startswith("#"):
+            continue
+        fields = line.rstrip("\n").split("\t")
+        values = dict(re.findall(r'(\w+) "([^"]*)"', fields[8]))
+        gene = values["gene_id"]
+        if fields[2] == "gene":
+            attributes = f"ID=gene-{gene};Dbxref=GeneID:{gene[4:].lstrip('0')},HGNC:HGNC:{gene[-5:]};Name={values['gene_name']};gene_biotype={values['gene_biotype']}"
+        elif fields[2] == "transcript":
+            fields[2] = "mRNA"
+            attributes = f"ID=rna-{values['transcript_id']};Parent=gene-{gene};product={values['gene_name']}%2C transcript variant;transcript_id={values['transcript_id']}"
+        elif fields[2] == "exon":
+            attributes = f"ID=exon-{values['exon_id']};Parent=rna-{values['transcript_id']};transcript_id={values['transcript_id']}"
+        else:
+            attributes = f"ID=cds-{values['protein_id']};Parent=rna-{values['transcript_id']};protein_id={values['protein_id']}"
+        out.append("\t".join(fields[:8] + [attributes]) + "\n")
+    return "".join(out).encode()
+
+
+def bgzf_compress(contents: bytes) -> bytes:
+    """Compress bytes into BGZF blocks the way `bgzip` does, ending with the empty EOF block.
+
+    Args:
+        contents (bytes): The uncompressed bytes
+
+    Returns:
+        bytes: The BGZF-compressed bytes
+    """
+    blocks = []
+    for start in [*range(0, len(contents), 65280), len(contents)]:
+        piece = contents[start:start + 65280]
+        deflater = zlib.compressobj(6, zlib.DEFLATED, -15)
+        compressed = deflater.compress(piece) + deflater.flush()
+        header = b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00" + struct.pack("<H", len(compressed) + 25)
+        blocks.append(header + compressed + struct.pack("<II", zlib.crc32(piece), len(piece)))
+    return b"".join(blocks)
+
+
+def _legacy_parse_attributes(text: str) -> dict:
+    """The per-row attribute parser used before the streaming parser"""
+    result = {}
+    for match in re.finditer(r'(\w+)\s+((?:"[^"]+"\s*)+)', text):
+        values = re.findall(r'"([^"]+)"', match.group(2))
+        result[match.group(1)] = values[0] if len(values) == 1 else ", ".join(values)
+    return result
+
+
+def _legacy_parse(contents: bytes, compressed: bool = False) -> pd.DataFrame:
+    """The single `pd.read_csv` call with a per-row converter used before the streaming parser"""
+    df = pd.read_csv(
+        gzip.open(io.BytesIO(contents), "r") if compressed else io.BytesIO(contents),
+        delimiter="\t",
+        header=None,
+        comment="#",
+        skip_blank_lines=True,
+        names=gtf.GTF_COLUMNS,
+        converters={"attribute": _legacy_parse_attributes}
+    )
+    df.insert(8, 'gene id', [i["gene_id"] for i in df['attribute']])
+    for j in df['attribute']:
+        del j["gene_id"]
+    return df
+
+
+def _legacy_summarize(df: pd.DataFrame, attributes: list[str]) -> pd.DataFrame:
+    """The per-gene `groupby().apply` summary used before the vectorized aggregation"""
+    generows = df[df['feature'] == 'gene'].iloc[:, [8,0,3,4,6]]
+    user_defined_cols = df.groupby('gene id').apply(
+        lambda x: pd.Series({
+            key: ';'.join(sorted(set(str(d[key]) for d in x['attribute'] if key in d)))
+            for key in attributes
+        }),
+        include_groups=False
+    ).reset_index()
+    return generows.merge(user_defined_cols, on='gene id', how='left')
+
+
+def _timed(function, *args, **kwargs) -> tuple[float, object]:
+    """Call a function and return the elapsed seconds alongside its result"""
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def _traced_memory(function, *args, **kwargs) -> tuple[float, float]:
+    """Call a function again under tracemalloc and return the MB held by its result and its peak allocation"""
+    tracemalloc.start()
+    result = function(*args, **kwargs)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return retained / 1e6, peak / 1e6
+
+
+def _rss(field: str) -> float:
+    """Read a memory field (`VmRSS` or `VmHWM`) of the current process from /proc in MB"""
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith(field):
+                return int(line.split()[1]) / 1e3
+    return 0.0
+
+
+def _rss_worker(contents: bytes, legacy: bool) -> tuple[float, float]:
+    """Parse gzipped GTF bytes and return the peak and the retained growth of the RSS in MB"""
+    before = _rss("VmRSS")
+    # writing 5 to clear_refs resets the peak RSS (VmHWM) of the process
+    with open("/proc/self/clear_refs", "w") as clear_refs:
+        clear_refs.write("5")
+    if legacy:
+        table = _legacy_parse(contents, compressed=True)
+    else:
+        table = gtf.parse_gtf(gtf.open_annotation("synthetic.gtf.gz", contents))
+    return _rss("VmHWM") - before, _rss("VmRSS") - before
+
+
+def _peak_rss(contents: bytes, legacy: bool) -> tuple[float, float]:
+    """Run `_rss_worker` in a freshly spawned process so that earlier runs do not affect the measurement"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(_rss_worker, contents, legacy).result()
+
+
+def parse(lines: int = 1_000_000, seed: int = 0) -> None:
+    """Compare the streaming parser with the legacy `parse_attributes` converter.
+
+    Args:
+        lines (int): Approximate number of rows in the synthetic GTF
+        seed (int): Seed for the random number generator
+    """
+    contents = synthetic_gtf(lines, seed)
+    logger.info(f"Synthetic GTF: {lines} rows, {len(contents) / 1e6:.1f} MB")
+
+    legacy_time, _ = _timed(_legacy_parse, contents)
+    legacy_table, legacy_peak = _traced_memory(_legacy_parse, contents)
+    logger.info(f"parse_attributes converter: {legacy_time:.2f} s, table {legacy_table:.0f} MB, peak {legacy_peak:.0f} MB")
+
+    streaming_time, _ = _timed(gtf.parse_gtf, io.BytesIO(contents))
+    streaming_table, streaming_peak = _traced_memory(gtf.parse_gtf, io.BytesIO(contents))
+    logger.info(f"streaming parser: {streaming_time:.2f} s, table {streaming_table:.0f} MB, peak {streaming_peak:.0f} MB")
+    logger.info(f"Speedup: {legacy_time / streaming_time:.1f}x")
+
+
+def aggregate(lines: int = 1_000_000, seed: int = 0) -> None:
+    """Compare the vectorized gene summary with the legacy per-gene `groupby().apply`.
+
+    Both summaries are built for every attribute key and must be byte-identical once written as CSV.
+
+    Args:
+        lines (int): Approximate number of rows in the synthetic GTF
+        seed (int): Seed for the random number generator
+    """
+    contents = synthetic_gtf(lines, seed)
+    legacy = _legacy_parse(contents)
+    table = gtf.parse_gtf(io.BytesIO(contents))
+    attributes = gtf.attribute_keys(table)
+    logger.info(f"Synthetic GTF: {lines} rows, {(table['feature'] == 'gene').sum()} genes, {len(attributes)} attributes")
+
+    legacy_time, legacy_summary = _timed(_legacy_summarize, legacy, attributes)
+    logger.info(f"groupby().apply: {legacy_time:.2f} s")
+
+    vectorized_time, summary = _timed(gtf.summarize_genes, table, attributes)
+    logger.info(f"vectorized: {vectorized_time:.3f} s")
+
+    if legacy_summary.to_csv(index=False) != summary.to_csv(index=False):
+        logger.error("The summary tables differ")
+        sys.exit(1)
+    logger.info(f"Summary tables are identical. Speedup: {legacy_time / vectorized_time:.1f}x")
+
+
+def rollups(lines: int = 1_000_000, seed: int = 0) -> None:
+    """Time the gene summary with and without the transcript and exon rollups.
+
+    Args:
+        lines (int): Approximate number of rows in the synthetic GTF
+        seed (int): Seed for the random number generator
+    """
+    table = gtf.parse_gtf(io.BytesIO(synthetic_gtf(lines, seed)))
+    logger.info(f"Synthetic GTF: {len(table)} rows, {(table['feature'] == 'exon').sum()} exons")
+    plain_time, _ = _timed(gtf.summarize_genes, table, [])
+    rollup_time, summary = _timed(gtf.summarize_genes, table, [], rollups=True)
+    logger.info(f"gene rows only: {plain_time:.2f} s, with rollups: {rollup_time:.2f} s for {len(summary)} genes")
+
+
+def gff3(lines: int = 1_000_000, seed: int = 0) -> None:
+    """Compare parsing a GFF3 file with parsing a GTF file holding the same features.
+
+    Args:
+        lines (int): Approximate number of rows in the synthetic files
+        seed (int): Seed for the random number generator
+    """
+    for label, contents in [("GTF", synthetic_gtf(lines, seed)), ("GFF3", synthetic_gff3(lines, seed))]:
+        elapsed, table = _timed(gtf.parse_annotation, "synthetic", contents, workers=1)
+        genes = table.loc[table["feature"] == "gene", "gene id"].nunique()
+        logger.info(f"{label}: {len(contents) / 1e6:.0f} MB parsed in {elapsed:.2f} s, {len(table)} rows of {genes} genes")
+
+
+def memory(lines: int = 1_000_000, seed: int = 0) -> None:
+    """Compare the peak RSS of parsing a gzipped GTF with the old and the streaming loader.
+
+    The memory measurements read /proc and therefore only work on Linux.
+
+    Args:
+        lines (int): Approximate number of rows in the synthetic GTF
+        seed (int): Seed for the random number generator
+    """
+    contents = gzip.compress(synthetic_gtf(lines, seed))
+    logger.info(f"Synthetic GTF: {lines} rows, {len(contents) / 1e6:.1f} MB gzipped")
+    for label, legacy in [("gzip.open + pd.read_csv", True), ("streaming parser", False)]:
+        peak, retained = _peak_rss(contents, legacy)
+        logger.info(f"{label}: peak RSS +{peak:.0f} MB, RSS held by the parsed table +{retained:.0f} MB")
+
+
+def dtypes(lines: int = 1_000_000, seed: int = 0) -> None:
+    """Compare the in-memory size of each column with the compact dtypes against object strings and 64-bit coordinates.
+
+    Args:
+        lines (int): Approximate number of rows in the synthetic GTF
+        seed (int): Seed for the random number generator
+    """
+    table = gtf.parse_gtf(io.BytesIO(synthetic_gtf(lines, seed)))
+    wide = table.astype({
+        column: object if dtype == "category" else "int64"
+        for column, dtype in gtf.GTF_DTYPES.items() if column in table.columns
+    })
+    compact_sizes = table.memory_usage(deep=True, index=False) / 1e6
+    wide_sizes = wide.memory_usage(deep=True, index=False) / 1e6
+    for column in table.columns[:8]:
+        logger.info(f"{column}: {wide_sizes[column]:.1f} MB -> {compact_sizes[column]:.1f} MB ({table[column].dtype})")
+    logger.info(f"attribute columns: {compact_sizes.iloc[8:].sum():.1f} MB (categorical in both)")
+    logger.info(f"whole table: {wide_sizes.sum():.1f} MB -> {compact_sizes.sum():.1f} MB")
+
+
+def preview(lines: tuple = (100_000, 1_000_000), seed: int = 0) -> None:
+    """Time how long a gzipped GTF takes to show its first parsed rows against how long it takes to parse completely.
+
+    Args:
+        lines (tuple): Approximate numbers of rows in the synthetic GTFs
+        seed (int): Seed for the random number generator
+    """
+    for size in lines if isinstance(lines, tuple) else (lines,):
+        contents = gzip.compress(synthetic_gtf(size, seed))
+        start = time.perf_counter()
+        first = []
+        gtf.parse_annotation("synthetic.gtf.gz", contents, progress=lambda block: first or first.append(time.perf_counter() - start))
+        total = time.perf_counter() - start
+        logger.info(f"{size} rows: first rows after {first[0]:.2f} s, whole file after {total:.2f} s")
+
+
+def bgzf(lines: int = 1_000_000, seed: int = 0, workers: tuple = (2, 4, 8)) -> None:
+    """Time the parsing of a BGZF-compressed GTF with different numbers of worker processes.
+
+    Args:
+        lines (int): Approximate number of rows in the synthetic GTF
+        seed (int): Seed for the random number generator
+        workers (tuple): Numbers of worker processes to compare with the sequential parser
+    """
+    contents = bgzf_compress(synthetic_gtf(lines, seed))
+    logger.info(f"Synthetic GTF: {lines} rows, {len(contents) / 1e6:.1f} MB BGZF-compressed")
+    sequential_time, sequential = _timed(gtf.parse_gtf, gtf.open_annotation("synthetic.gtf.gz", contents))
+    logger.info(f"sequential: {sequential_time:.2f} s")
+    for n_workers in ([workers] if isinstance(workers, int) else workers):
+        parallel_time, parallel = _timed(gtf.parse_annotation, "synthetic.gtf.gz", contents, n_workers)
+        if not parallel.equals(sequential):
+            logger.error(f"The table parsed with {n_workers} workers differs from the sequential one")
+            sys.exit(1)
+        logger.info(f"{n_workers} workers: {parallel_time:.2f} s, speedup {sequential_time / parallel_time:.1f}x")
+
+
+def intervals(lines: int = 1_000_000, seed: int = 0, queries: int = 10_000, width: int = 1_000_000) -> None:
+    """Time overlap queries against the interval index and check them against a full scan of the table.
+
+    Args:
+        lines (int): Approximate number of rows in the synthetic GTF
+        seed (int): Seed for the random number generator
+        queries (int): Number of random regions to query
+        width (int): Width of each queried region in bp
+    """
+    table = gtf.parse_gtf(io.BytesIO(synthetic_gtf(lines, seed)))
+    build_time, index = _timed(gtf.build_interval_index, table)
+    logger.info(f"Indexed {len(table)} features on {len(index)} sequences in {build_time:.2f} s")
+
+    rng = random.Random(seed)
+    regions = [(seqname, start, start + width) for seqname, start in zip(rng.choices(list(index), k=queries), (rng.randint(1, 100_000_000) for _ in range(queries)))]
+    query_time, hits = _timed(lambda: [gtf.query_overlaps(index, *region) for region in regions])
+    logger.info(f"{queries} queries of {width} bp: {query_time / queries * 1e6:.0f} µs per query, {sum(map(len, hits)) / queries:.0f} features per region")
+
+    scan_time, scans = _timed(lambda: [
+        ((table['seqname'] == seqname) & (table['start'] <= end) & (table['end'] >= start)).to_numpy().nonzero()[0]
+        for seqname, start, end in regions[:100]
+    ])
+    logger.info(f"full table scan: {scan_time / 100 * 1e6:.0f} µs per query")
+    if any(set(hit) != set(scan) for hit, scan in zip(hits, scans)):
+        logger.error("The index and the full scan disagree")
+        sys.exit(1)
+
+
+def cache(lines: int = 1_000_000, seed: int = 0) -> None:
+    """Time a first upload, which parses and caches the table, against a repeat upload of the same bytes and a repeat load of the same file on disk.
+
+    Args:
+        lines (int): Approximate number of rows in the synthetic GTF
+        seed (int): Seed for the random number generator
+    """
+    contents = synthetic_gtf(lines, seed)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        first_time, _ = _timed(gtf.load_annotation, "synthetic.gtf", contents, cache_dir)
+        logger.info(f"first upload (parse and cache): {first_time:.2f} s")
+        repeat_time, (_, cached) = _timed(gtf.load_annotation, "synthetic.gtf", contents, cache_dir)
+        logger.info(f"repeat upload (from cache: {cached}): {repeat_time:.2f} s, of which hashing {_timed(gtf.cache_path, contents, cache_dir)[0]:.2f} s")
+        path = Path(cache_dir) / "synthetic.gtf"
+        path.write_bytes(contents)
+        gtf.load_annotation(path.name, path, cache_dir)
+        file_time, (_, cached) = _timed(gtf.load_annotation, path.name, path, cache_dir)
+        logger.info(f"repeat load of a file on disk (from cache: {cached}): {file_time:.2f} s")
+
+
+if __name__ == '__main__':
+    fire.Fire({"parse": parse, "aggregate": aggregate, "rollups": rollups, "gff3": gff3, "memory": memory, "dtypes": dtypes, "preview": preview, "bgzf": bgzf, "intervals": intervals, "cache": cache})
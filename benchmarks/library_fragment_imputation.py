@@ -0,0 +1,187 @@
+"""
+Benchmarks for the Fragment Analysis Library Pooling app.
+
+This script times the imputation models and the diagnostic chart of
+`apps/library_fragment_imputation.py` on synthetic smear results and compares them to the
+scikit-learn fits and the matplotlib figure they replaced.
+
+The script can be run from the command line:
+    uv run benchmarks/library_fragment_imputation.py models --samples 96 --predictions 1000
+    uv run benchmarks/library_fragment_imputation.py chart --predictions 1000
+    uv run benchmarks/library_fragment_imputation.py coldstart
+"""
+
+# /// script
+# requires-python = ">=3.12"
+# dependencies = [
+#     "altair",
+#     "marimo",
+#     "matplotlib",
+#     "pandas",
+#     "scikit-learn",
+#     "fire==0.7.0",
+#     "loguru==0.7.0"
+# ]
+# ///
+import io
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import fire
+import numpy as np
+import pandas as pd
+
+from loguru import logger
+
+APPS = Path(__file__).resolve().parent.parent / "apps"
+sys.path.insert(0, str(APPS))
+import library_fragment_imputation as imputation
+
+
+def synthetic_scaled(samples: int = 96, seed: int = 0) -> pd.DataFrame:
+    """Generate the scaled-concentration table of a smear run, as the app computes it before imputation.
+
+    Args:
+        samples (int): Number of samples
+        seed (int): Seed for the random number generator
+
+    Returns:
+        pd.DataFrame: The `Sample ng/µL` of every sample and the responses the app imputes
+    """
+    rng = np.random.default_rng(seed)
+    quant = rng.uniform(0.1, 30, samples)
+    corrected = np.clip(0.6 * quant * rng.normal(1, 0.1, samples), 0, None)
+    size = np.round(rng.normal(500, 60, samples) + 20 * np.log(quant))
+    return pd.DataFrame({
+        "Sample ID": [f"sample_{number}" for number in range(1, samples + 1)],
+        "Avg.Size": size,
+        "Sample ng/µL": quant,
+        "Est. nM": corrected / (size * 660) * 1000000,
+        "Corrected ng/µL": corrected
+    })
+
+
+def _legacy_models(predict_table: pd.DataFrame, x_seq: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """The six scikit-learn fits used before the batched `fit_models`, as predictions and R² shaped like its output"""
+    from sklearn.linear_model import LinearRegression
+
+    x = np.log(predict_table["Sample ng/µL"].values).reshape(-1, 1)
+    x_linear = predict_table["Sample ng/µL"].values.reshape(-1, 1)
+    predictions = np.empty((2, len(x_seq), len(imputation.RESPONSES)))
+    r2 = np.empty((2, len(imputation.RESPONSES)))
+    for column, response in enumerate(imputation.RESPONSES):
+        y = predict_table[response].values
+        fit = LinearRegression().fit(x, y)
+        fitlinear = LinearRegression().fit(x_linear, y)
+        predictions[0, :, column] = fit.predict(np.log(x_seq).reshape(-1, 1))
+        predictions[1, :, column] = fitlinear.predict(x_seq.reshape(-1, 1))
+        r2[:, column] = fit.score(x, y), fitlinear.score(x_linear, y)
+    return predictions, r2
+
+
+def _batched_models(predict_table: pd.DataFrame, x_seq: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """The app's batched fit, as predictions and R²"""
+    coefficients, r2 = imputation.fit_models(predict_table["Sample ng/µL"].to_numpy(), predict_table[imputation.RESPONSES].to_numpy())
+    return imputation.design_matrices(x_seq) @ coefficients, r2
+
+
+def _legacy_figure(calc_table: pd.DataFrame, x_seq: np.ndarray, predictions: np.ndarray) -> bytes:
+    """The three-panel matplotlib figure drawn before `diagnostic_chart`, rendered to the PNG the app used to send"""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig, axes = plt.subplots(3, 1, sharex=True, figsize=(11, 7))
+    for ax, column, colors in zip(axes, range(len(imputation.RESPONSES)), [('dodgerblue', 'lightsteelblue'), ('darkseagreen', 'lightsteelblue'), ('#009999', '#99d6d6')]):
+        ax.scatter(calc_table["Sample ng/µL"], calc_table[imputation.RESPONSES[column]], color="black", label="Smear Data")
+        ax.scatter(x_seq, predictions[0, :, column], facecolors='none', edgecolors=colors[0], marker='.', label="Log Model")
+        ax.scatter(x_seq, predictions[1, :, column], facecolors=colors[1], edgecolors=None, marker='.', label="Linear Model")
+        ax.set_ylim(0, None)
+        ax.legend()
+    plt.tight_layout()
+    png = io.BytesIO()
+    fig.savefig(png, format="png")
+    plt.close(fig)
+    return png.getvalue()
+
+
+def _timed(function, *args, repeats: int = 5, **kwargs) -> tuple[float, object]:
+    """Call a function `repeats` times and return the fastest elapsed seconds alongside its result"""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def models(samples: tuple = (24, 96, 384), predictions: int = 1000, seed: int = 0) -> None:
+    """Compare the batched least-squares fit of all models with the six scikit-learn fits and check that they agree.
+
+    Args:
+        samples (tuple): Numbers of smear-analyzed samples to fit, comma-separated
+        predictions (int): Number of samples to impute
+        seed (int): Seed for the random number generator
+    """
+    x_seq = np.random.default_rng(seed + 1).uniform(0.1, 30, predictions)
+    for size in samples if isinstance(samples, tuple) else (samples,):
+        table = synthetic_scaled(size, seed)
+        predict_table = table[table["Sample ng/µL"] >= 0.2]
+        legacy_time, (legacy_predictions, legacy_r2) = _timed(_legacy_models, predict_table, x_seq)
+        batched_time, (batched_predictions, batched_r2) = _timed(_batched_models, predict_table, x_seq)
+        agree = np.allclose(legacy_predictions, batched_predictions) and np.allclose(legacy_r2, batched_r2)
+        logger.info(
+            f"{size} samples, {predictions} imputed: scikit-learn {legacy_time * 1000:.2f} ms, batched {batched_time * 1000:.3f} ms "
+            f"({legacy_time / batched_time:.0f}x), same predictions and R²: {agree}"
+        )
+        if not agree:
+            sys.exit(1)
+
+
+def chart(samples: int = 96, predictions: int = 1000, seed: int = 0) -> None:
+    """Time redrawing the diagnostic panels: the Altair spec the app sends against the matplotlib PNG it replaced.
+
+    Args:
+        samples (int): Number of smear-analyzed samples
+        predictions (int): Number of samples to impute
+        seed (int): Seed for the random number generator
+    """
+    import marimo as mo
+
+    table = synthetic_scaled(samples, seed)
+    x_seq = np.random.default_rng(seed + 1).uniform(0.1, 30, predictions)
+    coefficients, r2 = imputation.fit_models(table["Sample ng/µL"].to_numpy(), table[imputation.RESPONSES].to_numpy())
+    fitted = imputation.design_matrices(x_seq) @ coefficients
+    legacy_time, _ = _timed(_legacy_figure, table, x_seq, fitted)
+    chart_time, _ = _timed(lambda: mo.ui.altair_chart(imputation.diagnostic_chart(table, x_seq, fitted, r2), chart_selection=False, legend_selection=False))
+    logger.info(
+        f"{samples} samples, {predictions} imputed: matplotlib PNG {legacy_time * 1000:.0f} ms, Altair chart {chart_time * 1000:.0f} ms "
+        f"({legacy_time / chart_time:.0f}x)"
+    )
+
+
+def coldstart(repeats: int = 3) -> None:
+    """Time a fresh interpreter importing the app, i.e. running its setup cell, with and without the scikit-learn, statsmodels and matplotlib imports it used to have.
+
+    Args:
+        repeats (int): Number of fresh interpreters to start for each variant; the fastest is reported
+    """
+    app = f"import sys; sys.path.insert(0, {str(APPS)!r}); import library_fragment_imputation"
+    variants = {
+        "app": app,
+        "app + matplotlib": f"import matplotlib.pyplot; {app}",
+        "app + scikit-learn + statsmodels + matplotlib": f"import sklearn.linear_model, statsmodels.formula.api, matplotlib.pyplot; {app}"
+    }
+    for name, code in variants.items():
+        best = float("inf")
+        for _ in range(repeats):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "-c", code], check=True)
+            best = min(best, time.perf_counter() - start)
+        logger.info(f"{name}: {best * 1000:.0f} ms")
+
+
+if __name__ == '__main__':
+    fire.Fire({"models": models, "chart": chart, "coldstart": coldstart})
@@ -0,0 +1,249 @@
+"""
+Benchmarks for the Smear-Scaled Concentrations app.
+
+This script times the pooling calculation of `apps/smear_analysis.py` on synthetic fragment
+analyzer tables and compares it to the per-well implementation it replaced.
+
+The script can be run from the command line:
+    uv run benchmarks/smear_analysis.py pooling --samples 96,384,1536
+    uv run benchmarks/smear_analysis.py traces --samples 96 --points 5000
+"""
+
+# /// script
+# requires-python = ">=3.12"
+# dependencies = [
+#     "marimo",
+#     "pandas",
+#     "fire==0.7.0",
+#     "loguru==0.7.0"
+# ]
+# ///
+import random
+import sys
+import time
+from pathlib import Path
+
+import fire
+import numpy as np
+import pandas as pd
+
+from loguru import logger
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "apps"))
+import smear_analysis as smear
+
+INTERVALS = ["10 bp to 100 bp", "100 bp to 450 bp", "450 bp to 800 bp", "800 bp to 5500 bp"]
+
+
+def plate_wells(samples: int) -> list[str]:
+    """The wells of the smallest 96-, 384- or 1536-well plate that holds `samples` samples, row by row.
+
+    Args:
+        samples (int): Number of samples
+
+    Returns:
+        list[str]: Well names such as `A1` or `AF48`
+    """
+    rows = [chr(65 + i) for i in range(26)] + ["A" + chr(65 + i) for i in range(6)]
+    columns = 12 if samples <= 96 else 24 if samples <= 384 else 48
+    return [f"{row}{column}" for row in rows for column in range(1, columns + 1)][:samples]
+
+
+def synthetic_smear(samples: int = 96, seed: int = 0) -> pd.DataFrame:
+    """Generate a smear table with four size intervals per sample, as the app holds it after import.
+
+    Args:
+        samples (int): Number of samples
+        seed (int): Seed for the random number generator
+
+    Returns:
+        pd.DataFrame: The smear table with a `concentration (ng/µL)` column for every sample
+    """
+    rng = random.Random(seed)
+    rows = []
+    for number, well in enumerate(plate_wells(samples), 1):
+        concentration = round(rng.uniform(1, 50), 2)
+        for interval in INTERVALS:
+            rows.append({
+                "Well": well,
+                "Sample ID": f"sample_{number}",
+                "Range": interval,
+                "ng/µL": round(rng.uniform(0, 5), 4),
+                "% Total": round(rng.uniform(0, 100), 1),
+                "nmole/L": round(rng.uniform(0, 20), 4),
+                "Avg. Size": rng.randint(40, 1300),
+                "%CV": round(rng.uniform(5, 50), 2),
+                "Size Threshold (b.p.)": 300,
+                "DQN": 8.6,
+                "concentration (ng/µL)": concentration
+            })
+    return pd.DataFrame(rows)
+
+
+def synthetic_trace(samples: int = 96, points: int = 5000, seed: int = 0) -> bytes:
+    """Generate an electropherogram export: a log-spaced size grid and one RFU trace per well.
+
+    Each trace is a primer-dimer peak around 60 bp on top of a log-normal library smear
+    centered anywhere between 300 and 900 bp.
+
+    Args:
+        samples (int): Number of samples
+        points (int): Number of points of the size grid
+        seed (int): Seed for the random number generator
+
+    Returns:
+        bytes: The CSV export, with a `Size (bp)` column and columns named like `A1: sample_1`
+    """
+    rng = np.random.default_rng(seed)
+    sizes = np.geomspace(1, 10000, points)
+    centers = rng.uniform(np.log(300), np.log(900), (samples, 1))
+    smear = rng.uniform(200, 2000, (samples, 1)) * np.exp(-((np.log(sizes) - centers) ** 2) / (2 * 0.4 ** 2))
+    dimers = rng.uniform(0, 500, (samples, 1)) * np.exp(-((sizes - 60) ** 2) / (2 * 8 ** 2))
+    wells = plate_wells(samples)
+    columns = {"Size (bp)": sizes} | {f"{well}: sample_{number}": trace for number, (well, trace) in enumerate(zip(wells, smear + dimers), 1)}
+    return pd.DataFrame(columns).to_csv(index=False).encode()
+
+
+def _legacy_process_sample(group: pd.DataFrame, target_identifier: str, all_intervals: list[str], picomoles: float) -> pd.Series:
+    """The per-well calculation used before the column-wise `pool_samples`"""
+    target_row = group[group['Range'] == target_identifier].iloc[0]
+    corrected_sum = group[group['Range'] != all_intervals[0]]['ng/µL'].sum()
+    target_conc = target_row['ng/µL']
+    target_size = target_row['Avg. Size']
+    sample_id = target_row['Sample ID']
+    corrected_smear = target_conc/corrected_sum
+    quant = target_row['concentration (ng/µL)']
+    nM = (quant * corrected_smear) / (target_size * 660) * 1000000
+    if nM > 0:
+        vol_to_pool = picomoles / nM
+    else:
+        vol_to_pool = 0
+    ng_primary_lib = quant * vol_to_pool
+    return pd.Series(
+        {
+        'Sample ID': sample_id,
+        'Avg.Size': target_size,
+        '% of Total Conc.': round(corrected_smear * 100,1),
+        'Window ng/µL': round(target_conc,3),
+        'Sample ng/µL': quant,
+        'Est. nM': round(nM, 2),
+        'Corrected ng/µL': round(quant * corrected_smear,3),
+        'Volume to Pool': round(vol_to_pool, 2),
+        'ng Primary Library': round(ng_primary_lib, 1)
+    })
+
+
+def _legacy_pool_samples(df: pd.DataFrame, target_identifier: str, all_intervals: list[str], picomoles: float) -> pd.DataFrame:
+    """The `groupby('Well').apply` used before the column-wise `pool_samples`"""
+    return df.groupby('Well', sort = False).apply(
+        lambda group: _legacy_process_sample(group, target_identifier, all_intervals, picomoles),
+        include_groups=False
+    )
+
+
+def _quants(table: pd.DataFrame) -> pd.DataFrame:
+    """The sample concentrations of a synthetic smear table, as they come out of the app's data editor"""
+    return table[['Sample ID', 'concentration (ng/µL)']].drop_duplicates('Sample ID').reset_index(drop=True)
+
+
+def _timed(function, *args, repeats: int = 5, **kwargs) -> tuple[float, object]:
+    """Call a function `repeats` times and return the fastest elapsed seconds alongside its result"""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def pooling(samples: tuple = (96, 384, 1536), seed: int = 0, picomoles: float = 15.0) -> None:
+    """Compare the column-wise pooling calculation with the legacy per-well `groupby().apply` and check that their tables match.
+
+    Args:
+        samples (tuple): Numbers of samples to time, comma-separated
+        seed (int): Seed for the random number generator
+        picomoles (float): Target picomoles of each library
+    """
+    for size in samples if isinstance(samples, tuple) else (samples,):
+        table = synthetic_smear(size, seed)
+        quants = _quants(table)
+        intervals = smear.natural_sort(set(table['Range']))
+        legacy_time, legacy = _timed(_legacy_pool_samples, table, intervals[-2], intervals, picomoles)
+        vectorized_time, vectorized = _timed(smear.pool_samples, table.drop(columns=quants.columns[1]), quants, intervals[-2], intervals, picomoles)
+        identical = legacy.to_csv() == vectorized.to_csv()
+        logger.info(
+            f"{size} samples: groupby().apply {legacy_time * 1000:.1f} ms, pool_samples {vectorized_time * 1000:.2f} ms "
+            f"({legacy_time / vectorized_time:.0f}x), identical output: {identical}"
+        )
+        if not identical:
+            sys.exit(1)
+
+
+def stages(samples: tuple = (96, 384, 1536), seed: int = 0, picomoles: float = 15.0) -> None:
+    """Time each stage of the pooling calculation, i.e. what a change of each input of the app reruns.
+
+    Args:
+        samples (tuple): Numbers of samples to time, comma-separated
+        seed (int): Seed for the random number generator
+        picomoles (float): Target picomoles of each library
+    """
+    for size in samples if isinstance(samples, tuple) else (samples,):
+        table = synthetic_smear(size, seed)
+        quants = _quants(table)
+        table = table.drop(columns=quants.columns[1])
+        intervals = smear.natural_sort(set(table['Range']))
+        matrix_time, matrix = _timed(smear.smear_matrix, table)
+        windows_time, windows = _timed(smear.window_fractions, matrix, intervals[-2], intervals[0])
+        joined_time, joined = _timed(smear.join_concentrations, windows, quants)
+        volumes_time, _ = _timed(smear.pool_volumes, joined, picomoles)
+        logger.info(
+            f"{size} samples: upload {matrix_time * 1000:.2f} ms, target range {windows_time * 1000:.2f} ms, concentrations {joined_time * 1000:.2f} ms, "
+            f"picomoles slider {volumes_time * 1000:.2f} ms"
+        )
+
+
+def runs(plates: int = 12, samples: int = 384, seed: int = 0, picomoles: float = 15.0) -> None:
+    """Time reading the CSV exports of several plates and pooling all of their samples together.
+
+    Args:
+        plates (int): Number of plates, i.e. of uploaded files
+        samples (int): Number of samples on each plate
+        seed (int): Seed for the random number generator
+        picomoles (float): Target picomoles of each library
+    """
+    files = []
+    for plate in range(plates):
+        table = synthetic_smear(samples, seed + plate).drop(columns='concentration (ng/µL)').rename(columns={'ng/µL': 'ng/uL'})
+        files.append((f"plate_{plate + 1}.csv", table.to_csv(index=False).encode()))
+    # read_smear_export caches by content, so only the first read parses the plates
+    read_time, (table, _) = _timed(smear.read_smear_runs, files, repeats=1)
+    quants = table[['Sample ID']].drop_duplicates().assign(**{'concentration (ng/µL)': 10.0})
+    intervals = smear.natural_sort(set(table['Range']))
+    pool_time, pooled = _timed(smear.pool_samples, table, quants, intervals[-2], intervals, picomoles)
+    logger.info(f"{plates} plates of {samples} samples: read {read_time * 1000:.0f} ms, pooled {len(pooled)} wells in {pool_time * 1000:.1f} ms")
+
+
+def traces(samples: int = 96, points: int = 5000, windows: str = "10-100, 100-450, 450-800, 800-5500", seed: int = 0) -> None:
+    """Time reading an electropherogram export and integrating its traces over custom size windows.
+
+    Args:
+        samples (int): Number of samples
+        points (int): Number of points of each trace
+        windows (str): Size windows to integrate, e.g. `10-100, 100-450`
+        seed (int): Seed for the random number generator
+    """
+    contents = synthetic_trace(samples, points, seed)
+    # the reader caches by content, so only its first call parses
+    read_time, trace = _timed(smear.read_trace_export, contents, repeats=1)
+    spans = smear.parse_windows(windows)
+    integrate_time, table = _timed(smear.trace_windows, trace, spans)
+    matrix_time, _ = _timed(smear.smear_matrix, table)
+    total = read_time + integrate_time + matrix_time
+    logger.info(
+        f"{samples} traces of {points} points, {len(spans)} windows: read {read_time * 1000:.0f} ms, "
+        f"integrate {integrate_time * 1000:.1f} ms, matrix {matrix_time * 1000:.1f} ms, total {total * 1000:.0f} ms"
+    )
+
+
+if __name__ == '__main__':
+    fire.Fire({"pooling": pooling, "stages": stages, "runs": runs, "traces": traces})
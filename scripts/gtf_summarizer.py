@@ -0,0 +1,185 @@
+"""
+Command-line GTF Summarizer.
+
+This script summarizes GTF files to one row per gene without the marimo UI, reusing the parsing
+and summarizing functions of `apps/GTF_summarizer.py`. Files are processed concurrently, one per
+worker process, and the time and peak memory of each file are logged.
+
+The script can be run from the command line:
+    uv run scripts/gtf_summarizer.py GRCh38.gtf.gz GRCm39.gtf.gz --attributes gene_name,gene_biotype --output_format parquet
+"""
+
+# /// script
+# requires-python = ">=3.13"
+# dependencies = [
+#     "marimo",
+#     "pandas==2.3.3",
+#     "pyarrow",
+#     "fire==0.7.0",
+#     "loguru==0.7.0"
+# ]
+# ///
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import resource
+import sys
+import time
+from pathlib import Path
+from typing import List, Union
+
+import fire
+
+from loguru import logger
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "apps"))
+import GTF_summarizer as gtf
+
+
+def _output_path(path: Path, output_dir: Path, output_format: str) -> Path:
+    """The summary file written for an annotation, e.g. `GRCh38.gtf.gz` -> `GRCh38.summary.tsv`"""
+    name = path.name.removesuffix(".gz").removesuffix(".GZ")
+    return output_dir / f"{Path(name).stem}.summary.{output_format}"
+
+
+def _output_paths(paths: List[Path], output_dir: Path, output_format: str) -> List[Path]:
+    """The summary file of each annotation, with files of the same name from different folders prefixed by their folder, then numbered"""
+    outputs = []
+    for path in paths:
+        output = _output_path(path, output_dir, output_format)
+        if output in outputs:
+            folder = path.resolve().parent.name
+            output = base = output.with_name(f"{folder}_{output.name}" if folder else output.name)
+            copy = 1
+            while output in outputs:
+                copy += 1
+                output = base.with_name(f"{base.name.split('.summary.')[0]}_{copy}.summary.{output_format}")
+            logger.warning(f"{path}: another file has the same name, writing its summary to {output.name}")
+        outputs.append(output)
+    return outputs
+
+
+def _peak_rss() -> float:
+    """The peak resident memory of the current process in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+
+def _summarize_file(path: Path, output: Path, attributes: List[str] | None, rollups: bool, cache: bool, filters: dict) -> dict:
+    """Parse and summarize a single GTF file and write the summary table.
+
+    Args:
+        path (Path): Path to the GTF file (optionally gzip- or BGZF-compressed)
+        output (Path): Path of the summary file; the suffix selects TSV or Parquet
+        attributes (List[str] | None): Attributes to summarize per gene, all of them if None
+        rollups (bool): Whether to add the transcript and exon metrics of each gene
+        cache (bool): Whether to read and write the parsed-annotation cache
+        filters (dict): Parse-time filters passed on to the parser
+
+    Returns:
+        dict: Timing, size and peak-memory statistics of the file
+    """
+    start = time.perf_counter()
+    if cache:
+        # keyed on the path, size and modification time, so a cached file is not read at all
+        df, _ = gtf.load_annotation(path.name, path, **filters)
+    else:
+        # the files are already spread over the worker processes
+        df = gtf.parse_annotation(path.name, path.read_bytes(), workers=1, **filters)
+    parsed = time.perf_counter()
+
+    keys = gtf.attribute_keys(df)
+    if attributes is not None:
+        missing = [key for key in attributes if key not in keys]
+        if missing:
+            logger.warning(f"{path}: no {', '.join(missing)} attribute, left out of its summary")
+        keys = [key for key in attributes if key in keys]
+    summary = gtf.summarize_genes(df, keys, rollups)
+    if output.suffix == ".parquet":
+        summary.to_parquet(output, index=False)
+    else:
+        summary.to_csv(output, sep="\t", index=False)
+    return {
+        "rows": len(df),
+        "genes": len(summary),
+        "parse": parsed - start,
+        "summarize": time.perf_counter() - parsed,
+        "peak_rss": _peak_rss()
+    }
+
+
+def main(
+    *paths: Union[str, Path],
+    attributes: Union[str, List[str], None] = None,
+    output_format: str = "tsv",
+    output_dir: Union[str, Path] = ".",
+    workers: int | None = None,
+    features: Union[str, List[str], None] = None,
+    primary_only: bool = False,
+    rollups: bool = False,
+    cache: bool = False,
+) -> None:
+    """Summarize GTF files to one row per gene.
+
+    Command line arguments:
+        paths: GTF or GFF3 files to summarize (.gtf, .gff, .gff3, optionally .gz or BGZF compressed)
+        --attributes: Attributes to summarize per gene, comma-separated (default: all)
+        --output_format: Format of the summary tables, `tsv` or `parquet` (default: tsv)
+        --output_dir: Directory where the summary tables are written (default: current directory)
+        --workers: Number of files processed at once (default: number of CPUs)
+        --features: Only keep these feature types, comma-separated (`gene` is always kept)
+        --primary_only: Skip scaffolds, patches and unplaced contigs
+        --rollups: Add transcript and exon counts, exonic length and longest transcript length per gene
+        --cache: Read and write the parsed-annotation cache, keyed on the path, size and modification time of each file
+
+    Returns:
+        None
+    """
+    if output_format not in ("tsv", "parquet"):
+        logger.error(f"Unsupported output format: {output_format}")
+        sys.exit(1)
+    if isinstance(attributes, str):
+        attributes = [i.strip() for i in attributes.split(",") if i.strip()]
+    if isinstance(features, str):
+        features = [i.strip() for i in features.split(",") if i.strip()]
+    # the rollups need the exon rows and the transcript ids even if they are filtered out of the summary
+    filters = {
+        "features": {"gene", *features, *(["exon"] if rollups else [])} if features else None,
+        "seqnames": gtf.PRIMARY_SEQNAMES if primary_only else None,
+        "attributes": [*attributes, *(["transcript_id"] if rollups else [])] if attributes else None
+    }
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    paths = [Path(path) for path in paths]
+    if not paths:
+        logger.warning("No GTF files given!")
+        return
+
+    failed = 0
+    # a fresh process per file keeps the peak memory of each file separate
+    with ProcessPoolExecutor(workers, max_tasks_per_child=1) as pool:
+        futures = {
+            pool.submit(_summarize_file, path, output, attributes, rollups, cache, filters): path
+            for path, output in zip(paths, _output_paths(paths, output_dir, output_format))
+        }
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                stats = future.result()
+            except Exception as e:
+                logger.error(f"Error summarizing {path}: {e}")
+                failed += 1
+                continue
+            logger.info(
+                f"{path}: {stats['rows']} rows, {stats['genes']} genes | "
+                f"parse {stats['parse']:.2f} s, summarize {stats['summarize']:.2f} s | peak RSS {stats['peak_rss']:.0f} MB"
+            )
+
+    logger.info(f"Summarized {len(paths) - failed} out of {len(paths)} files into {output_dir}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    fire.Fire(main)
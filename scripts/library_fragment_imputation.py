@@ -0,0 +1,178 @@
+"""
+Command-line Smear-Imputed Molarity.
+
+This script imputes the smear-corrected concentration, molarity and fragment size of libraries
+from the fragment analysis of a subset of them without the marimo UI, reusing the functions of
+`apps/library_fragment_imputation.py`. It writes one row per library with the fitted values and
+their confidence, prediction and, optionally, bootstrap intervals. The bootstrap resamples are
+spread over a process pool. It can also fit every interval of the export as the target range
+to compare them.
+
+The script can be run from the command line:
+    uv run scripts/library_fragment_imputation.py impute smear.csv quants.csv --target_range "450 bp to 800 bp" --bootstrap 10000
+    uv run scripts/library_fragment_imputation.py compare smear.csv quants.csv --output_prefix plate_1
+"""
+
+# /// script
+# requires-python = ">=3.12"
+# dependencies = [
+#     "altair",
+#     "marimo",
+#     "pandas",
+#     "fire==0.7.0",
+#     "loguru==0.7.0"
+# ]
+# ///
+
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Union
+
+import fire
+import numpy as np
+import pandas as pd
+
+from loguru import logger
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "apps"))
+import library_fragment_imputation as imputation
+
+
+def _read_concentrations(path: Path) -> pd.DataFrame:
+    """Read a table of `Sample ID` and concentration (ng/µL) columns, as CSV or, with a `.tsv` suffix, tab-separated"""
+    quants = pd.read_csv(path, sep="\t" if path.suffix.lower() == ".tsv" else ",", dtype={"Sample ID": str})
+    if "Sample ID" not in quants.columns or len(quants.columns) != 2:
+        raise ValueError(f"{path} must have two columns: `Sample ID` and the concentration in ng/µL")
+    return quants.set_axis(["Sample ID", "concentration (ng/µL)"], axis=1)
+
+
+def _bootstrap(x: np.ndarray, y: np.ndarray, x_new: np.ndarray, resamples: int, level: float, workers: int, seed: int) -> tuple[np.ndarray, np.ndarray]:
+    """The bootstrap intervals of both models, with the resamples split evenly over `workers` processes"""
+    sizes = [len(chunk) for chunk in np.array_split(np.arange(resamples), workers) if len(chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    with ProcessPoolExecutor(len(sizes)) as pool:
+        chunks = list(pool.map(imputation.bootstrap_coefficients, [x] * len(sizes), [y] * len(sizes), sizes, seeds))
+    return imputation.bootstrap_intervals(np.concatenate(chunks, axis=1), x_new, level)
+
+
+def _read_export(smear: Path) -> pd.DataFrame:
+    """Read a smear export, exiting with an error if it is not one"""
+    table = imputation.read_smear_export(smear.read_bytes())
+    if table is None:
+        logger.error(f"{smear} is not a fragment analyzer smear export with the columns {', '.join(imputation.SMEAR_COLUMNS)}")
+        sys.exit(1)
+    return table
+
+
+def impute(
+    smear: Union[str, Path],
+    concentrations: Union[str, Path],
+    target_range: str | None = None,
+    model: str = "auto",
+    min_concentration: float = 0.2,
+    level: float = 0.95,
+    bootstrap: int = 0,
+    workers: int | None = None,
+    seed: int = 0,
+    output: Union[str, Path] = "imputed.tsv",
+) -> None:
+    """Impute the smear-corrected concentration, molarity and size of every library in a concentration table.
+
+    Command line arguments:
+        smear: Fragment analyzer CSV export of the libraries that were analyzed
+        concentrations: CSV (or .tsv) table of `Sample ID` and concentration in ng/µL of every library
+        --target_range: Target interval, e.g. `450 bp to 800 bp`, or intervals joined by `+` to merge them into one window (default: the second-to-last interval)
+        --model: `auto` to use, for each value, the model with the smallest leave-one-out error, or one of the models `Log Model`, `Linear Model`, `Log Huber`, `Linear Huber`, `Log Theil-Sen`, `Linear Theil-Sen`, `Log WLS`, `Linear WLS` and `Isotonic` (default: auto)
+        --min_concentration: Analyzed libraries below this ng/µL are left out of the fit (default: 0.2)
+        --level: Confidence level of the intervals (default: 0.95)
+        --bootstrap: Number of bootstrap resamples of the OLS models, 0 for the analytic intervals only (default: 0)
+        --workers: Number of processes for the bootstrap (default: the number of CPUs)
+        --seed: Seed of the bootstrap resamples (default: 0)
+        --output: Path of the tab-separated output table (default: imputed.tsv)
+
+    Returns:
+        None
+    """
+    if model != "auto" and model not in imputation.CANDIDATES:
+        logger.error(f"Unknown model `{model}`, expected `auto` or one of {', '.join(imputation.CANDIDATES)}")
+        sys.exit(1)
+    table = _read_export(Path(smear))
+    quants = _read_concentrations(Path(concentrations))
+    matrix = imputation.smear_matrix(table)
+    intervals = list(matrix['ranges'])
+    target = [intervals[-2]] if target_range is None else [interval.strip() for interval in target_range.split("+")]
+    for interval in target:
+        if interval not in intervals:
+            logger.error(f"{smear} has no `{interval}` interval; its intervals are {', '.join(intervals)}")
+            sys.exit(1)
+
+    windows = imputation.window_fractions(matrix, target, intervals[0])
+    calc_table = imputation.scale_concentrations(imputation.join_concentrations(windows, quants))
+    fitted = (calc_table["Sample ng/µL"] >= min_concentration) & (calc_table["Sample ng/µL"] > 0) & calc_table[imputation.RESPONSES].notna().all(axis=1)
+    if not fitted.all():
+        logger.warning(f"Left out of the fit, below {min_concentration} ng/µL or without the target range: {', '.join(calc_table.loc[~fitted, 'Sample ID'].astype(str))}")
+    if fitted.sum() < imputation.MIN_FITTED:
+        logger.error(f"Only {fitted.sum()} analyzed libraries are at or above {min_concentration} ng/µL and have the target range; the models need at least {imputation.MIN_FITTED}")
+        sys.exit(1)
+    predict_table = calc_table[fitted]
+    x = predict_table["Sample ng/µL"].to_numpy(dtype=float)
+    y = predict_table[imputation.RESPONSES].to_numpy(dtype=float)
+    x_new = quants["concentration (ng/µL)"].to_numpy(dtype=float)
+    logger.info(f"Fitting {len(x)} analyzed libraries to impute {len(x_new)}")
+
+    candidates = imputation.fit_candidates(x, y)
+    cv_error = imputation.loo_rmse(candidates)
+    if model == "auto":
+        selected = np.argmin(np.where(np.isnan(cv_error), np.inf, cv_error), axis=0)
+    else:
+        selected = np.full(len(imputation.RESPONSES), imputation.CANDIDATES.index(model))
+    for response, candidate in zip(imputation.RESPONSES, selected):
+        logger.info(f"{response}: {imputation.CANDIDATES[candidate]} (leave-one-out RMSE {cv_error[candidate, imputation.RESPONSES.index(response)]:.3f})")
+
+    ols = imputation.prediction_intervals(x, y, x_new, level)
+    bounds = None
+    missing = imputation.missing_intervals(selected, bool(bootstrap))
+    if missing:
+        logger.warning(missing)
+    if bootstrap and (selected < len(imputation.MODELS)).any():
+        workers = workers or os.cpu_count() or 1
+        logger.info(f"Refitting the models to {bootstrap} bootstrap resamples over {workers} processes")
+        bounds = _bootstrap(x, y, x_new, bootstrap, level, workers, seed)
+    imputed, *intervals = imputation.selected_intervals(candidates, selected, x_new, level, ols, bounds)
+    imputation.uncertainty_table(quants["Sample ID"].to_numpy(), x_new, imputed, *intervals).to_csv(output, sep="\t", index=False)
+    logger.info(f"Wrote {output}")
+
+
+def compare(
+    smear: Union[str, Path],
+    concentrations: Union[str, Path],
+    min_concentration: float = 0.2,
+    output_prefix: Union[str, Path] = "intervals",
+) -> None:
+    """Impute every library with each interval of a smear export as the target range and compare the intervals.
+
+    Command line arguments:
+        smear: Fragment analyzer CSV export of the libraries that were analyzed
+        concentrations: CSV (or .tsv) table of `Sample ID` and concentration in ng/µL of every library
+        --min_concentration: Analyzed libraries below this ng/µL are left out of the fits (default: 0.2)
+        --output_prefix: Prefix of the `.comparison.tsv` table, one row per interval, and the `.molarity.tsv` table of the imputed nM of every library with every interval (default: intervals)
+
+    Returns:
+        None
+    """
+    matrix = imputation.smear_matrix(_read_export(Path(smear)))
+    quants = _read_concentrations(Path(concentrations))
+    intervals = list(matrix['ranges'])
+    quant, responses = imputation.interval_responses(matrix, intervals[0], quants)
+    logger.info(f"Fitting {len(quant)} analyzed libraries with each of {len(intervals)} intervals as the target range")
+    summary, molarity = imputation.compare_intervals(quant, responses, intervals, quants["concentration (ng/µL)"].to_numpy(dtype=float), min_concentration)
+    summary.to_csv(f"{output_prefix}.comparison.tsv", sep="\t", index=False)
+    molarity.insert(0, "Sample", quants["Sample ID"].to_numpy())
+    molarity.to_csv(f"{output_prefix}.molarity.tsv", sep="\t", index=False)
+    logger.info(f"Wrote {output_prefix}.comparison.tsv and {output_prefix}.molarity.tsv")
+
+
+if __name__ == '__main__':
+    fire.Fire({"impute": impute, "compare": compare})
@@ -0,0 +1,232 @@
+"""
+Command-line Smear-Scaled Concentrations.
+
+This script computes the volume of each library to pool from fragment analyzer smear exports
+without the marimo UI, reusing the functions of `apps/smear_analysis.py`. It writes a pooling
+table and the final pooling metrics for every export, either for the files it is given or for
+every export that lands in a watched directory.
+
+The script can be run from the command line:
+    uv run scripts/smear_analysis.py pool plate_1.csv plate_2.csv --concentrations quants.csv --target_range "450 bp to 800 bp"
+    uv run scripts/smear_analysis.py watch exports/ --concentrations quants.csv --output_dir pooling/
+"""
+
+# /// script
+# requires-python = ">=3.12"
+# dependencies = [
+#     "marimo",
+#     "pandas",
+#     "pyarrow",
+#     "fire==0.7.0",
+#     "loguru==0.7.0"
+# ]
+# ///
+
+import hashlib
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Union
+
+import fire
+import pandas as pd
+
+from loguru import logger
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "apps"))
+import smear_analysis as smear
+
+# parsed exports are cached as Parquet files, evicting the least recently used past CACHE_SIZE bytes
+CACHE_DIR = Path(tempfile.gettempdir()) / "smear_analysis_cache"
+CACHE_SIZE = 500_000_000
+# part of the cache key, so that tables cached by an older parser are not reused
+CACHE_VERSION = 2
+
+
+def _read_concentrations(path: Path) -> pd.DataFrame:
+    """Read a table of `Sample ID` and concentration (ng/µL) columns, as CSV or, with a `.tsv` suffix, tab-separated"""
+    quants = pd.read_csv(path, sep="\t" if path.suffix.lower() == ".tsv" else ",", dtype={"Sample ID": str})
+    if "Sample ID" not in quants.columns or len(quants.columns) != 2:
+        raise ValueError(f"{path} must have two columns: `Sample ID` and the concentration in ng/µL")
+    return quants.set_axis(["Sample ID", "concentration (ng/µL)"], axis=1)
+
+
+def _evict_cache(cache_dir: Path, max_size: int) -> None:
+    """Delete the least recently used cached exports until the cache is no larger than `max_size` bytes"""
+    cached = sorted(cache_dir.glob("*.parquet"), key=lambda path: path.stat().st_mtime)
+    total = sum(path.stat().st_size for path in cached)
+    # the most recently used table is kept even if it alone exceeds the limit
+    for path in cached[:-1]:
+        if total <= max_size:
+            break
+        total -= path.stat().st_size
+        path.unlink(missing_ok=True)
+
+
+def _read_export(path: Path, cache_dir: Path | None, cache_size: int = CACHE_SIZE) -> pd.DataFrame:
+    """Read a smear export, from the parsed-file cache if the same bytes were read before.
+
+    Args:
+        path (Path): Path to the fragment analyzer CSV export
+        cache_dir (Path | None): Directory of the parsed-file cache, or None to always parse
+        cache_size (int): Size in bytes past which the least recently used cached exports are deleted
+
+    Returns:
+        pd.DataFrame: The smear table of the export
+    """
+    contents = path.read_bytes()
+    digest = hashlib.blake2b(contents, digest_size=20)
+    digest.update(repr(CACHE_VERSION).encode())
+    cached = None if cache_dir is None else cache_dir / f"{digest.hexdigest()}.parquet"
+    if cached is not None and cached.exists():
+        # the modification time orders the cache for eviction
+        os.utime(cached)
+        return pd.read_parquet(cached)
+    table, unrecognized = smear.read_smear_runs([(path.name, contents)])
+    if unrecognized:
+        raise ValueError(f"{path} is not a fragment analyzer smear export with the columns {', '.join(smear.SMEAR_COLUMNS)}")
+    if cached is not None:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = cached.with_suffix(".partial")
+        table.to_parquet(tmp_path, index=False)
+        tmp_path.replace(cached)
+        _evict_cache(cache_dir, cache_size)
+    return table
+
+
+def _pool_export(path: Path, quants: pd.DataFrame, target_range: str | None, picomoles: float, elution_volume: float, output_dir: Path, cache_dir: Path | None, cache_size: int = CACHE_SIZE) -> None:
+    """Compute and write the pooling table and metrics of a single smear export"""
+    table = _read_export(path, cache_dir, cache_size)
+    intervals = list(table['Range'].cat.categories)
+    target = [intervals[-2]] if target_range is None else [interval.strip() for interval in target_range.split("+")]
+    for interval in target:
+        if interval not in intervals:
+            raise ValueError(f"{path} has no `{interval}` interval; its intervals are {', '.join(intervals)}")
+    missing = set(table['Sample ID']) - set(quants['Sample ID'])
+    if missing:
+        logger.warning(f"{path}: no concentration for {', '.join(sorted(missing))}")
+
+    calc_table = smear.pool_samples(table, quants, target, intervals, picomoles)
+    calc_table.to_csv(output_dir / f"{path.stem}.pooling.tsv", sep="\t")
+    smear.pooling_metrics(calc_table, picomoles, elution_volume).to_csv(output_dir / f"{path.stem}.metrics.tsv", sep="\t", index=False)
+    logger.info(f"{path}: pooled {len(calc_table)} wells at target range {' + '.join(target)}")
+
+
+def pool(
+    *paths: Union[str, Path],
+    concentrations: Union[str, Path],
+    target_range: str | None = None,
+    picomoles: float = 15.0,
+    elution_volume: float = 20.0,
+    output_dir: Union[str, Path] = ".",
+) -> None:
+    """Compute the volume of each library to pool for fragment analyzer smear exports.
+
+    Command line arguments:
+        paths: Fragment analyzer CSV exports, each pooled on its own
+        --concentrations: CSV (or .tsv) table of `Sample ID` and concentration in ng/µL
+        --target_range: Target interval, e.g. `450 bp to 800 bp`, or intervals joined by `+` to merge them into one window (default: the second-to-last interval)
+        --picomoles: Target picomoles for the final libraries (default: 15)
+        --elution_volume: Volume to elute in, in µL (default: 20)
+        --output_dir: Directory where the `.pooling.tsv` and `.metrics.tsv` tables are written (default: current directory)
+
+    Returns:
+        None
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    quants = _read_concentrations(Path(concentrations))
+    failed = 0
+    for path in map(Path, paths):
+        try:
+            _pool_export(path, quants, target_range, picomoles, elution_volume, output_dir, None)
+        except Exception as e:
+            logger.error(f"Error pooling {path}: {e}")
+            failed += 1
+    if failed:
+        sys.exit(1)
+
+
+def watch(
+    directory: Union[str, Path],
+    concentrations: Union[str, Path],
+    target_range: str | None = None,
+    picomoles: float = 15.0,
+    elution_volume: float = 20.0,
+    output_dir: Union[str, Path] = ".",
+    interval: float = 5.0,
+    cache_dir: Union[str, Path] = CACHE_DIR,
+    cache_size: int = CACHE_SIZE,
+) -> None:
+    """Pool every fragment analyzer export that lands in a directory, until interrupted.
+
+    A file is processed once its size has stayed the same for one polling interval, so exports
+    that are still being copied are not read half-written. Changing the concentrations table
+    pools every export again, reusing their parsed tables from the cache; a table that cannot be
+    read is reported and the previous one kept until the file changes again.
+
+    Command line arguments:
+        directory: Directory to watch for `.csv` exports
+        --concentrations: CSV (or .tsv) table of `Sample ID` and concentration in ng/µL
+        --target_range: Target interval, e.g. `450 bp to 800 bp`, or intervals joined by `+` to merge them into one window (default: the second-to-last interval)
+        --picomoles: Target picomoles for the final libraries (default: 15)
+        --elution_volume: Volume to elute in, in µL (default: 20)
+        --output_dir: Directory where the `.pooling.tsv` and `.metrics.tsv` tables are written (default: current directory)
+        --interval: Seconds between scans of the directory (default: 5)
+        --cache_dir: Directory of the parsed-file cache, kept across runs (default: a folder in the temporary directory)
+        --cache_size: Size in bytes past which the least recently used cached exports are deleted (default: 500 MB)
+
+    Returns:
+        None
+    """
+    directory, concentrations, output_dir, cache_dir = Path(directory), Path(concentrations), Path(output_dir), Path(cache_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    logger.info(f"Watching {directory} for fragment analyzer exports, press Ctrl+C to stop")
+    sizes = {}
+    processed = {}
+    quants_mtime = None
+    quants = None
+    try:
+        while True:
+            try:
+                mtime = concentrations.stat().st_mtime
+            except OSError:
+                # the table is missing for a moment while an editor replaces it
+                mtime = quants_mtime
+            if mtime != quants_mtime:
+                quants_mtime = mtime
+                try:
+                    quants = _read_concentrations(concentrations)
+                except Exception as e:
+                    # a half-written or invalid table keeps the last one that was read, until the file changes again
+                    logger.error(f"Error reading {concentrations}: {e}")
+                else:
+                    processed.clear()
+            if quants is None:
+                time.sleep(interval)
+                continue
+            for path in sorted(directory.glob("*.[cC][sS][vV]")):
+                try:
+                    stat = path.stat()
+                except OSError:
+                    # the export was moved or deleted since the directory was listed
+                    sizes.pop(path, None)
+                    continue
+                previous, sizes[path] = sizes.get(path), stat.st_size
+                if previous != stat.st_size or processed.get(path) == stat.st_mtime:
+                    continue
+                try:
+                    _pool_export(path, quants, target_range, picomoles, elution_volume, output_dir, cache_dir, cache_size)
+                except Exception as e:
+                    logger.error(f"Error pooling {path}: {e}")
+                # a failed file is retried only once it changes
+                processed[path] = stat.st_mtime
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        logger.info("Stopped watching")
+
+
+if __name__ == '__main__':
+    fire.Fire({"pool": pool, "watch": watch})